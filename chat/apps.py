@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+class ChatConfig(AppConfig):
+    name = 'chat'
+
+    def ready(self):
+        from .search import restore_search_triggers
+
+        post_migrate.connect(restore_search_triggers, sender=self)
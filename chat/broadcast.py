@@ -0,0 +1,47 @@
+import json
+
+from . import wire
+from .replay import event_log
+
+
+def frame_message(message_type, key, payload, seq=None):
+    message = {'type': message_type, key: payload}
+    if seq is not None:
+        message['seq'] = seq
+    return message
+
+
+def build_frame(message_type, key, payload, seq=None):
+    """Encode a client-facing event as the exact text frame sockets will receive."""
+    return json.dumps(frame_message(message_type, key, payload, seq))
+
+
+async def broadcast(channel_layer, groups, message_type, key, payload, collapse_key=None):
+    """Send one event to ``groups``, JSON-encoding it once for every recipient.
+
+    Consumers receive a ``forward_frame`` event and write ``frame`` to the
+    socket unchanged, instead of each one calling ``json.dumps`` itself.
+    A socket in several of ``groups`` receives the event once per group;
+    the event's ``epoch`` and ``seq`` let it skip the repeats. Frames
+    sharing a ``collapse_key`` supersede each other in a backed-up send
+    queue. Every frame carries a ``seq`` from the replay log so a
+    reconnecting client can resume from where it left off. When msgpack is
+    available the event also carries the same message ``packed`` for
+    sockets on the binary subprotocol, encoded here just once as well.
+    """
+    if isinstance(groups, str):
+        groups = [groups]
+    messages = []
+
+    def build(seq):
+        messages.append(frame_message(message_type, key, payload, seq))
+        return json.dumps(messages[0])
+
+    epoch, frame = await event_log.record(groups, build)
+    event = {'type': 'forward_frame', 'frame': frame, 'epoch': epoch, 'seq': messages[0]['seq']}
+    if wire.msgpack is not None:
+        event['packed'] = wire.pack(messages[0])
+    if collapse_key is not None:
+        event['key'] = collapse_key
+    for group in groups:
+        await channel_layer.group_send(group, event)
@@ -0,0 +1,219 @@
+import atexit
+import threading
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import ChatMessage
+
+# Primary keys reserved from the database per round trip.
+ID_BLOCK_SIZE = 1000
+
+
+class IdBlockAllocator:
+    """Hands out ``ChatMessage`` primary keys before the rows exist.
+
+    Ids are reserved a block at a time by advancing the table's row in
+    SQLite's ``sqlite_sequence``, which AUTOINCREMENT always stays above. So
+    ordinary ``create()`` calls, other workers and other processes never
+    receive an id that was handed out here, and ids keep increasing.
+    """
+
+    def __init__(self, model, block_size=ID_BLOCK_SIZE):
+        self.model = model
+        self.block_size = block_size
+        self._next = self._end = 0
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Return the next reserved id, or None if the block is used up."""
+        with self._lock:
+            if self._next > self._end or not self._next:
+                return None
+            pk, self._next = self._next, self._next + 1
+            return pk
+
+    def reserve(self):
+        """Reserve a fresh block of ids (one UPDATE) and return the first of them."""
+        if connection.vendor != 'sqlite':
+            raise ImproperlyConfigured('Buffered chat persistence reserves ids through sqlite_sequence.')
+        table = self.model._meta.db_table
+        with connection.cursor() as cursor:
+            # The sequence row only appears after the first AUTOINCREMENT insert.
+            cursor.execute(
+                'INSERT INTO sqlite_sequence (name, seq) '
+                f'SELECT %s, COALESCE(MAX(id), 0) FROM "{table}" '
+                'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)',
+                [table, table],
+            )
+            cursor.execute(
+                'UPDATE sqlite_sequence SET seq = seq + %s WHERE name = %s RETURNING seq',
+                [self.block_size, table],
+            )
+            end = cursor.fetchone()[0]
+        with self._lock:
+            self._next, self._end = end - self.block_size + 2, end
+        return end - self.block_size + 1
+
+
+class ChatWriteBuffer:
+    """Write-behind persistence for chat messages.
+
+    ``add()`` assigns the message its id and timestamp in memory and returns
+    it straight away, so it can be broadcast before it is stored. A daemon
+    thread writes pending messages with one ``bulk_create`` as soon as
+    ``batch_size`` of them are waiting and otherwise every ``flush_interval``
+    seconds; whatever is left is written at interpreter exit.
+
+    A batch that violates a constraint (say, an author deleted before the
+    flush) is written again row by row and the offending rows are dropped.
+    A batch that fails for any other reason is kept and retried with the
+    next flush, up to ``max_retries`` times in a row before it is dropped.
+    At most ``max_pending`` messages are held; past that the oldest go.
+    Dropped messages are logged and counted in ``chat_messages_dropped``.
+
+    Anything still pending when the process is killed is lost, so
+    ``batch_size`` and ``flush_interval`` bound how much chat a crash can
+    cost.
+    """
+
+    def __init__(self, batch_size=100, flush_interval=0.2, max_retries=5, max_pending=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.max_pending = max_pending
+        self.ids = IdBlockAllocator(ChatMessage)
+        self._failures = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, content, author):
+        """Buffer one message and return it, id included."""
+        pk = self.ids.take()
+        if pk is None:
+            pk = self.ids.reserve()
+        return self._enqueue(ChatMessage(id=pk, content=content, author=author, created_at=timezone.now()))
+
+    async def aadd(self, content, author):
+        """``add()`` for the event loop; only a block reservation leaves it."""
+        pk = self.ids.take()
+        if pk is None:
+            pk = await database_sync_to_async(self.ids.reserve)()
+        return self._enqueue(ChatMessage(id=pk, content=content, author=author, created_at=timezone.now()))
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Write every pending message. Returns the number of rows written."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+        try:
+            ChatMessage.objects.bulk_create(batch, batch_size=500)
+            written = len(batch)
+        except IntegrityError:
+            written = self._insert_each(batch)
+        except Exception:
+            self._failures += 1
+            if self._failures >= self.max_retries:
+                self._failures = 0
+                self._drop(batch, f'still failing after {self.max_retries} attempts')
+            else:
+                self._requeue(batch)
+            raise
+        self._failures = 0
+        return written
+
+    def _insert_each(self, batch):
+        """Write ``batch`` a row at a time, dropping the rows that violate a constraint."""
+        written = 0
+        for index, message in enumerate(batch):
+            try:
+                with transaction.atomic():
+                    ChatMessage.objects.bulk_create([message])
+            except IntegrityError as e:
+                self._drop([message], e)
+            except Exception:
+                self._requeue(batch[index:])
+                raise
+            else:
+                written += 1
+        return written
+
+    def _requeue(self, batch):
+        with self._lock:
+            self._pending = batch + self._pending
+            overflow = self._trim()
+        self._drop(overflow, 'buffer full')
+
+    def _trim(self):
+        # Caller holds the lock; returns the oldest messages past max_pending.
+        overflow = len(self._pending) - self.max_pending
+        if overflow <= 0:
+            return []
+        dropped, self._pending = self._pending[:overflow], self._pending[overflow:]
+        return dropped
+
+    def _drop(self, messages, reason):
+        if not messages:
+            return
+        metrics.increment('chat_messages_dropped', len(messages))
+        print(f"Dropped {len(messages)} chat messages (first id {messages[0].id}): {reason}")
+
+    def _enqueue(self, message):
+        with self._lock:
+            self._pending.append(message)
+            overflow = self._trim()
+            full = len(self._pending) >= self.batch_size
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='chat-write-buffer', daemon=True)
+                self._thread.start()
+        self._drop(overflow, 'buffer full')
+        if full:
+            self._wake.set()
+        return message
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing chat messages: {e}")
+                connection.close()
+
+
+def _build_write_buffer():
+    config = getattr(settings, 'CHAT_PERSISTENCE', {})
+    if config.get('MODE', 'immediate') != 'buffered':
+        return None
+    return ChatWriteBuffer(
+        batch_size=config.get('BATCH_SIZE', 100),
+        flush_interval=config.get('FLUSH_INTERVAL_MS', 200) / 1000,
+        max_retries=config.get('MAX_RETRIES', 5),
+        max_pending=config.get('MAX_PENDING', 10000),
+    )
+
+
+# None unless CHAT_PERSISTENCE selects buffered mode.
+chat_write_buffer = _build_write_buffer()
+
+
+@atexit.register
+def _flush_on_exit():
+    if chat_write_buffer is None:
+        return
+    try:
+        chat_write_buffer.flush()
+    except Exception as e:
+        print(f"Error flushing chat messages: {e}")
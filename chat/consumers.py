@@ -1,38 +1,167 @@
+import asyncio
 import json
+from collections import deque
+from django.conf import settings
+from django.db import transaction
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from channels.auth import get_user
-from .models import Thread, Reply, Vote, ChatMessage
-from django.contrib.auth.models import User
-from django.contrib.contenttypes.models import ContentType
+from .models import Category, Thread, Reply, ChatMessage
+from .votes import VOTABLE_MODELS, cast_vote
+from .notifications import notify
+from .groups import (
+    CHAT_GROUP, MAX_SUBSCRIPTIONS, THREADS_GROUP,
+    category_group, thread_group, topic_group, user_group,
+)
+from .presence import presence_tracker
+from .online import online_registry
+from .broadcast import broadcast
+from .sendqueue import COLLAPSE, SendQueue
+from .history import chat_history, older_messages
+from .chatbuffer import chat_write_buffer
+from .ratelimit import rate_limiter
+from .voteupdates import vote_updates
+from .ranking import record_reply
+from .replay import event_log
+from . import wire
 
 class ChatConsumer(AsyncWebsocketConsumer):
+    # Negotiated in connect(); JSON text frames unless the client asked for msgpack.
+    binary = False
+    compress = False
+
+    def init_connection_state(self):
+        """Per-socket state the send path relies on; connect() starts with it."""
+        self.subscriptions = set()
+        self.batch_window = 0
+        self.closing = False
+        # (epoch, seq) of recent broadcasts, to deliver each only once when
+        # the socket is in more than one of the groups it went to. Workers
+        # with a local event log number from 1 each, so seq alone is not unique.
+        self.recent_events = deque(maxlen=64)
+
+        queue_settings = getattr(settings, 'WEBSOCKET_SEND_QUEUE', {})
+        self.send_queue = SendQueue(
+            maxsize=queue_settings.get('maxsize', 200),
+            policy=queue_settings.get('policy', COLLAPSE),
+        )
+        self.close_timeout = queue_settings.get('close_timeout', 1)
+        self.writer_task = None
+
     async def connect(self):
-        self.room_group_name = 'forum'
         self.user = await get_user(self.scope)
+        self.init_connection_state()
 
-        # Join room group
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
+        # Binary clients offer the msgpack subprotocol; anyone else gets JSON text frames.
+        subprotocol = wire.choose_subprotocol(self.scope.get('subprotocols', []))
+        self.binary = subprotocol == wire.MSGPACK_SUBPROTOCOL
+
+        # Join the user's private group for notifications
+        if self.user.is_authenticated:
+            await self.channel_layer.group_add(
+                user_group(self.user.id),
+                self.channel_name
+            )
+            # Connect/disconnect always record a fresh timestamp; touch()
+            # only updates memory, and the tracker's thread does the write.
+            presence_tracker.touch(self.user.id, force=True)
+            online_registry.connect(self.user.id, self.channel_name)
+
+        await self.accept(subprotocol=subprotocol)
+        self.writer_task = asyncio.create_task(self.drain_send_queue())
+
+        # Tell the client where the event stream is, for a later resume
+        epoch, seq = await event_log.current()
+        await self.send_event({'type': 'hello', 'epoch': epoch, 'seq': seq})
 
-        await self.accept()
+        # Replay recent chat from the in-memory ring buffer
+        await self.send_event({
+            'type': 'chat_history',
+            'messages': await chat_history.recent(),
+        })
 
     async def disconnect(self, close_code):
-        # Leave room group
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
+        if self.writer_task:
+            self.writer_task.cancel()
+            self.writer_task = None
+
+        # Leave every topic group this socket subscribed to
+        for group in self.subscriptions:
+            await self.channel_layer.group_discard(group, self.channel_name)
+        self.subscriptions.clear()
 
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
+        if self.user.is_authenticated:
+            await self.channel_layer.group_discard(
+                user_group(self.user.id),
+                self.channel_name
+            )
+            online_registry.disconnect(self.user.id, self.channel_name)
+            presence_tracker.touch(self.user.id, force=True)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            try:
+                text_data_json = wire.decode_frame(bytes_data)
+            except Exception:
+                text_data_json = None
+            if not isinstance(text_data_json, dict):
+                await self.send_event({'error': 'Invalid binary frame'})
+                return
+        else:
+            try:
+                text_data_json = json.loads(text_data)
+            except ValueError:
+                text_data_json = None
+            if not isinstance(text_data_json, dict):
+                await self.send_event({'error': 'Invalid JSON frame'})
+                return
         message_type = text_data_json.get('type')
+        # Rate limit rules are looked up by type, which must be hashable.
+        if not isinstance(message_type, str):
+            await self.send_event({'error': 'Invalid message type'})
+            return
+
+        wait = await rate_limiter.athrottle(
+            message_type,
+            user_id=self.user.id if self.user.is_authenticated else None,
+            connection=self.channel_name,
+        )
+        if wait:
+            await self.send_event({
+                'error': 'Rate limit exceeded',
+                'event': message_type,
+                'retry_after': round(wait, 1),
+            })
+            return
+
+        if message_type == 'heartbeat':
+            if self.user.is_authenticated:
+                online_registry.heartbeat(self.user.id, self.channel_name)
+            return
+
+        if message_type in ('subscribe', 'unsubscribe'):
+            await self.handle_subscription(message_type, text_data_json)
+            return
+
+        if message_type == 'resume':
+            await self.resume(text_data_json.get('epoch'), text_data_json.get('last_seq'))
+            return
+
+        if message_type == 'chat_history':
+            await self.send_older_history(text_data_json.get('before_id'), text_data_json.get('limit', 50))
+            return
+
+        if message_type == 'set_batching':
+            await self.set_batching(text_data_json.get('window_ms'))
+            return
+
+        if message_type == 'set_compression':
+            await self.set_compression(text_data_json.get('enabled'))
+            return
 
         if message_type == 'new_thread':
             if not self.user.is_authenticated:
-                await self.send(text_data=json.dumps({'error': 'Authentication required'}))
+                await self.send_event({'error': 'Authentication required'})
                 return
             title = text_data_json.get('title')
             content = text_data_json.get('content')
@@ -40,51 +169,36 @@ class ChatConsumer(AsyncWebsocketConsumer):
             if title and content:
                 thread = await self.create_thread(title, content, category_id, self.user)
                 if thread:
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            'type': 'new_thread_message',
-                            'thread': {
-                                'id': thread.id,
-                                'title': thread.title,
-                                'content': thread.content,
-                                'author': thread.author.username,
-                                'category': thread.category.name if thread.category else 'General',
-                                'created_at': str(thread.created_at),
-                            }
-                        }
-                    )
+                    groups = [THREADS_GROUP]
+                    if thread['category_id']:
+                        groups.append(category_group(thread['category_id']))
+                    await broadcast(self.channel_layer, groups, 'new_thread', 'thread', {
+                        'id': thread['id'],
+                        'title': thread['title'],
+                        'content': thread['content'],
+                        'author': thread['author'],
+                        'category': thread['category'],
+                        'created_at': thread['created_at'],
+                    })
             else:
-                await self.send(text_data=json.dumps({'error': 'Invalid thread data'}))
+                await self.send_event({'error': 'Invalid thread data'})
 
         elif message_type == 'new_reply':
             if not self.user.is_authenticated:
-                await self.send(text_data=json.dumps({'error': 'Authentication required'}))
+                await self.send_event({'error': 'Authentication required'})
                 return
             thread_id = text_data_json.get('thread_id')
             content = text_data_json.get('content')
             if thread_id and content:
                 reply = await self.create_reply(thread_id, content, self.user)
                 if reply:
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            'type': 'new_reply_message',
-                            'reply': {
-                                'id': reply.id,
-                                'content': reply.content,
-                                'thread_id': reply.thread.id,
-                                'author': reply.author.username,
-                                'created_at': str(reply.created_at),
-                            }
-                        }
-                    )
+                    await broadcast(self.channel_layer, thread_group(reply['thread_id']), 'new_reply', 'reply', reply)
             else:
-                await self.send(text_data=json.dumps({'error': 'Invalid reply data'}))
+                await self.send_event({'error': 'Invalid reply data'})
 
         elif message_type == 'vote':
             if not self.user.is_authenticated:
-                await self.send(text_data=json.dumps({'error': 'Authentication required'}))
+                await self.send_event({'error': 'Authentication required'})
                 return
             model_type = text_data_json.get('model_type')
             object_id = text_data_json.get('object_id')
@@ -92,163 +206,308 @@ class ChatConsumer(AsyncWebsocketConsumer):
             if model_type and object_id is not None and vote_type in [1, -1]:
                 updated_vote = await self.handle_vote(model_type, object_id, vote_type, self.user)
                 if updated_vote:
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            'type': 'vote_update_message',
-                            'vote': {
-                                'model_type': model_type,
-                                'object_id': object_id,
-                                'vote_count': updated_vote['vote_count'],
-                                'user_vote': updated_vote['user_vote'],
-                            }
-                        }
-                    )
+                    # The voter's own state goes only to this socket; everyone
+                    # else gets the coalesced count.
+                    await self.send_event({'type': 'vote_update', 'vote': {
+                        'model_type': model_type,
+                        'object_id': object_id,
+                        'vote_count': updated_vote['vote_count'],
+                        'user_vote': updated_vote['user_vote'],
+                    }})
+                    await vote_updates.changed(self.channel_layer, model_type, object_id, updated_vote['thread_id'])
             else:
-                await self.send(text_data=json.dumps({'error': 'Invalid vote data'}))
+                await self.send_event({'error': 'Invalid vote data'})
 
         elif message_type == 'chat_message':
             if not self.user.is_authenticated:
-                await self.send(text_data=json.dumps({'error': 'Authentication required'}))
+                await self.send_event({'error': 'Authentication required'})
                 return
             content = text_data_json.get('content')
             if content:
                 message = await self.create_chat_message(content, self.user)
                 if message:
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            'type': 'chat_message_broadcast',
-                            'message': {
-                                'id': message['id'],
-                                'content': message['content'],
-                                'author': message['author'],
-                                'created_at': message['created_at'],
-                            }
-                        }
-                    )
+                    await chat_history.append(message)
+                    await broadcast(self.channel_layer, CHAT_GROUP, 'new_chat_message', 'message', {
+                        'id': message['id'],
+                        'content': message['content'],
+                        'author': message['author'],
+                        'created_at': message['created_at'],
+                    })
             else:
-                await self.send(text_data=json.dumps({'error': 'Content is required'}))
+                await self.send_event({'error': 'Content is required'})
 
-    @database_sync_to_async
-    def create_thread(self, title, content, category_id, user):
+    async def handle_subscription(self, action, data):
+        group = topic_group(data.get('topic'), data.get('id'))
+        if group is None:
+            await self.send_event({'error': 'Invalid topic'})
+            return
+
+        if action == 'subscribe':
+            if group not in self.subscriptions:
+                if len(self.subscriptions) >= MAX_SUBSCRIPTIONS:
+                    await self.send_event({'error': 'Too many subscriptions'})
+                    return
+                await self.channel_layer.group_add(group, self.channel_name)
+                self.subscriptions.add(group)
+        elif group in self.subscriptions:
+            await self.channel_layer.group_discard(group, self.channel_name)
+            self.subscriptions.discard(group)
+
+        await self.send_event({
+            'type': f'{action}d',
+            'topic': data.get('topic'),
+            'id': data.get('id'),
+        })
+
+    async def resume(self, epoch, last_seq):
+        """Replay broadcast frames missed since ``last_seq`` for the current subscriptions.
+
+        Clients re-subscribe first, then resume. If the replay window no
+        longer covers the gap (or the server's epoch changed) they get an
+        explicit resync_required and should reload over HTTP.
+        """
+        if not isinstance(last_seq, int):
+            await self.send_event({'error': 'last_seq must be an integer'})
+            return
+        missed = await event_log.since(epoch, last_seq, self.subscriptions)
+        if missed is None or len(missed) >= self.send_queue.maxsize:
+            # A replay the send queue can't hold would be cut short silently.
+            await self.send_event({
+                'type': 'resync_required',
+                'reason': 'replay_window_exceeded',
+            })
+            return
+        for frame in missed:
+            # The log keeps JSON frames; binary sockets get them repacked.
+            await self.enqueue_frame(wire.pack(json.loads(frame)) if self.binary else frame)
+        _epoch, seq = await event_log.current()
+        await self.enqueue_frame(self.encode_message({'type': 'resumed', 'replayed': len(missed), 'seq': seq}))
+
+    async def send_older_history(self, before_id, limit):
+        if not isinstance(before_id, int) or not isinstance(limit, int):
+            await self.send_event({'error': 'before_id and limit must be integers'})
+            return
+        messages, has_more = await older_messages(before_id, limit)
+        await self.send_event({
+            'type': 'chat_history',
+            'before_id': before_id,
+            'messages': messages,
+            'has_more': has_more,
+        })
+
+    async def set_batching(self, window_ms):
+        """Opt this socket in or out of batched delivery (``window_ms`` 0 turns it off)."""
+        max_window = getattr(settings, 'WEBSOCKET_BATCH_MAX_WINDOW_MS', 1000)
+        if not isinstance(window_ms, int) or not 0 <= window_ms <= max_window:
+            await self.send_event({'error': f'window_ms must be between 0 and {max_window}'})
+            return
+        self.batch_window = window_ms / 1000
+        await self.send_event({'type': 'batching', 'window_ms': window_ms})
+
+    async def set_compression(self, enabled):
+        """Toggle deflate for this socket's larger binary frames."""
+        if not self.binary:
+            await self.send_event({'error': f'Compression requires the {wire.MSGPACK_SUBPROTOCOL} subprotocol'})
+            return
+        self.compress = bool(enabled)
+        await self.send_event({'type': 'compression', 'enabled': self.compress})
+
+    def encode_message(self, message):
+        """Encode a message into a queueable frame for this socket's protocol."""
+        return wire.pack(message) if self.binary else json.dumps(message)
+
+    async def send_event(self, message):
+        await self.enqueue_frame(self.encode_message(message))
+
+    async def send_encoded(self, frame):
+        if self.binary:
+            await self.send(bytes_data=wire.encode_frame(frame, self.compress))
+        else:
+            await self.send(text_data=frame)
+
+    async def send_frame(self, frame, key=None):
+        """Queue a pre-encoded broadcast frame; it may go out in a batch."""
+        await self.enqueue_frame(frame, key, batchable=True)
+
+    async def enqueue_frame(self, frame, key=None, batchable=False):
+        if self.closing:
+            return
+        if not self.send_queue.put(frame, key, batchable):
+            await self.drop_slow_consumer()
+
+    async def drain_send_queue(self):
+        # Runs for the lifetime of the socket. send() waits while the
+        # client's socket buffer is full (see chat.sendqueue), so a client
+        # that reads slowly backs up here, bounded by the queue.
+        while True:
+            frame, batchable = await self.send_queue.get()
+            if batchable and self.batch_window:
+                # Hold the frame for the window; broadcasts queued meanwhile
+                # go out with it, still subject to the queue's bound.
+                await asyncio.sleep(self.batch_window)
+                await self.send_batch([(frame, batchable)] + self.send_queue.get_all())
+            else:
+                await self.send_encoded(frame)
+
+    async def send_batch(self, entries):
+        """Send runs of broadcast frames as arrays, and anything else on its own, in order."""
+        frames = []
+        for frame, batchable in entries + [(None, False)]:
+            if batchable:
+                frames.append(frame)
+                continue
+            if frames:
+                # The frames are already encoded, so the batch is joined rather than re-encoded.
+                await self.send_encoded(wire.pack_array(frames) if self.binary else '[' + ','.join(frames) + ']')
+                frames = []
+            if frame is not None:
+                await self.send_encoded(frame)
+
+    async def drop_slow_consumer(self):
+        # The writer is stuck in send() to a client that stopped reading, so
+        # it is cancelled rather than waited for, and whatever it had queued
+        # is superseded by the resync. The hint and the close each get
+        # close_timeout seconds; if even the close can't go out, the
+        # consumer stops and the server drops the connection.
+        self.closing = True
+        self.send_queue.clear()
+        if self.writer_task:
+            self.writer_task.cancel()
+            self.writer_task = None
+        try:
+            await asyncio.wait_for(self.send_encoded(self.encode_message({
+                'type': 'resync_required',
+                'reason': 'slow_consumer',
+            })), self.close_timeout)
+        except asyncio.TimeoutError:
+            pass
+        try:
+            await asyncio.wait_for(self.close(code=4008), self.close_timeout)
+        except asyncio.TimeoutError:
+            await self.websocket_disconnect({'code': 4008})
+
+    async def create_thread(self, title, content, category_id, user):
         try:
             category = None
             if category_id:
-                from .models import Category
-                category = Category.objects.get(id=category_id)
-            thread = Thread.objects.create(title=title, content=content, author=user, category=category)
-            return thread
+                category = await Category.objects.aget(id=category_id)
+            thread = await Thread.objects.acreate(title=title, content=content, author=user, category=category)
+            return {
+                'id': thread.id,
+                'title': thread.title,
+                'content': thread.content,
+                'author': user.username,
+                'category_id': category.id if category else None,
+                'category': category.name if category else 'General',
+                'created_at': str(thread.created_at),
+            }
         except Exception as e:
             print(f"Error creating thread: {e}")
             return None
 
+    # Replies take a single thread-pool hop, like votes: the Reply row, the
+    # thread's counters and the notification share one transaction, and
+    # each async ORM call would be a hop of its own.
     @database_sync_to_async
     def create_reply(self, thread_id, content, user):
         try:
-            thread = Thread.objects.get(id=thread_id)
-            reply = Reply.objects.create(thread=thread, content=content, author=user)
-
-            # Create notification for thread author if not the same user
-            if thread.author != user:
-                from .models import Notification
-                Notification.objects.create(
-                    user=thread.author,
-                    message=f"{user.username} replied to your thread '{thread.title}'",
-                    thread=thread,
-                    reply=reply
-                )
-
-            return reply
+            with transaction.atomic():
+                thread = Thread.objects.select_related('author').get(id=thread_id)
+                reply = Reply.objects.create(thread=thread, content=content, author=user)
+                record_reply(thread.id, reply.created_at)
+
+                # Create notification for thread author if not the same user
+                if thread.author_id != user.id:
+                    notify(
+                        thread.author,
+                        f"{user.username} replied to your thread '{thread.title}'",
+                        thread=thread,
+                        reply=reply
+                    )
+
+            return {
+                'id': reply.id,
+                'content': reply.content,
+                'thread_id': thread.id,
+                'author': user.username,
+                'created_at': str(reply.created_at),
+            }
         except Thread.DoesNotExist:
             return None
         except Exception as e:
             print(f"Error creating reply: {e}")
             return None
 
+    # Voting stays a single thread-pool hop: the Vote row and the counter
+    # update must share a transaction, which the async ORM cannot open.
     @database_sync_to_async
     def handle_vote(self, model_type, object_id, vote_type, user):
         try:
-            if model_type == 'thread':
-                content_type = ContentType.objects.get_for_model(Thread)
-                obj = Thread.objects.get(id=object_id)
-            elif model_type == 'reply':
-                content_type = ContentType.objects.get_for_model(Reply)
-                obj = Reply.objects.get(id=object_id)
-            else:
+            if model_type not in VOTABLE_MODELS:
                 return None
-
-            vote_obj, created = Vote.objects.get_or_create(
-                content_type=content_type,
-                object_id=object_id,
-                user=user,
-                defaults={'vote_type': vote_type}
-            )
-
-            if not created:
-                if vote_obj.vote_type == vote_type:
-                    vote_obj.delete()
-                else:
-                    vote_obj.vote_type = vote_type
-                    vote_obj.save()
-
-            return {'vote_count': obj.vote_count(), 'user_vote': obj.user_vote(user)}
+            return cast_vote(model_type, object_id, vote_type, user)
         except Exception as e:
             print(f"Error handling vote: {e}")
             return None
 
-    @database_sync_to_async
-    def create_chat_message(self, content, user):
+    async def create_chat_message(self, content, user):
         try:
-            message = ChatMessage.objects.create(content=content, author=user)
+            if chat_write_buffer is not None:
+                message = await chat_write_buffer.aadd(content, user)
+            else:
+                message = await ChatMessage.objects.acreate(content=content, author=user)
             return {
                 'id': message.id,
                 'content': message.content,
-                'author': message.author.username,
+                'author': user.username,
                 'created_at': message.created_at.isoformat(),
             }
         except Exception as e:
             print(f"Error creating chat message: {e}")
             return None
 
+    async def forward_frame(self, event):
+        # Pre-encoded by chat.broadcast; sent as-is to every recipient.
+        if event.get('seq') is not None:
+            origin = (event.get('epoch'), event['seq'])
+            if origin in self.recent_events:
+                return
+            self.recent_events.append(origin)
+        if self.binary:
+            frame = event['packed'] if 'packed' in event else wire.pack(json.loads(event['frame']))
+        else:
+            frame = event['frame']
+        await self.send_frame(frame, event.get('key'))
+
+    # Per-recipient encoding handlers, kept for events queued by older senders.
+
     async def new_thread_message(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send_event({
             'type': 'new_thread',
             'thread': event['thread']
-        }))
+        })
 
     async def new_reply_message(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send_event({
             'type': 'new_reply',
             'reply': event['reply']
-        }))
+        })
 
     async def vote_update_message(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send_event({
             'type': 'vote_update',
             'vote': event['vote']
-        }))
+        })
 
     async def chat_message_broadcast(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send_event({
             'type': 'new_chat_message',
             'message': event['message']
-        }))
-from channels.generic.websocket import AsyncWebsocketConsumer
-import json
-
-class ChatConsumer(AsyncWebsocketConsumer):
-    async def connect(self):
-        await self.accept()
-        await self.send(text_data=json.dumps({
-            "message": "✅ WebSocket connection established!"
-        }))
+        })
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
-        await self.send(text_data=json.dumps({
-            "message": f"Echo: {data.get('message', '')}"
-        }))
-
-    async def disconnect(self, close_code):
-        print("❌ WebSocket disconnected")
+    async def notification_message(self, event):
+        await self.send_event({
+            'type': 'notification',
+            'notification': event['notification'],
+            'unread_count': event['unread_count'],
+        })
@@ -0,0 +1,9 @@
+from .notifications import get_unread_count
+
+
+def unread_notifications(request):
+    """Expose the cached unread notification count to every template."""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {'unread_notifications': 0}
+    return {'unread_notifications': get_unread_count(user)}
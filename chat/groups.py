@@ -0,0 +1,42 @@
+# Channel-layer group names shared by the consumer and the code that
+# publishes to it from views and helpers.
+
+CHAT_GROUP = 'chat'
+
+# Every new thread, whatever its category (the index listing).
+THREADS_GROUP = 'threads'
+
+# Most topic groups one socket may be subscribed to at once.
+MAX_SUBSCRIPTIONS = 100
+
+
+def user_group(user_id):
+    """Private group holding every socket of one authenticated user."""
+    return f'user_{user_id}'
+
+
+def thread_group(thread_id):
+    """Replies and votes on one thread (and on its replies)."""
+    return f'thread_{thread_id}'
+
+
+def category_group(category_id):
+    """New threads in one category."""
+    return f'category_{category_id}'
+
+
+def topic_group(topic, object_id=None):
+    """Map a client ``subscribe`` request to a group name, or None if it is invalid."""
+    if topic == 'chat':
+        return CHAT_GROUP
+    if topic == 'threads':
+        return THREADS_GROUP
+    try:
+        object_id = int(object_id)
+    except (TypeError, ValueError):
+        return None
+    if topic == 'thread':
+        return thread_group(object_id)
+    if topic == 'category':
+        return category_group(object_id)
+    return None
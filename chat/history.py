@@ -0,0 +1,112 @@
+import json
+from collections import deque
+
+from django.conf import settings
+
+from .models import ChatMessage
+
+MAX_PAGE_SIZE = 100
+
+
+def serialize_message(message):
+    return {
+        'id': message.id,
+        'content': message.content,
+        'author': message.author.username,
+        'created_at': message.created_at.isoformat(),
+    }
+
+
+class LocalChatHistory:
+    """Ring buffer of the most recent chat messages, kept in this process.
+
+    Filled once from the database on first use, then only by ``append``, so
+    replaying it to a new socket never queries the database.
+    """
+
+    def __init__(self, size=50):
+        self.size = size
+        self._messages = deque(maxlen=size)
+        self._warm = False
+
+    async def append(self, message):
+        await self._ensure_warm()
+        # Buffered writes hand out ids in per-worker blocks, so a message can
+        # arrive after one with a higher id; it is inserted in id order.
+        position = len(self._messages)
+        while position and self._messages[position - 1]['id'] > message['id']:
+            position -= 1
+        # A warm-up triggered by this append may already have loaded it.
+        if position and self._messages[position - 1]['id'] == message['id']:
+            return
+        if len(self._messages) == self.size:
+            if not position:
+                return  # Older than everything held.
+            self._messages.popleft()
+            position -= 1
+        self._messages.insert(position, message)
+
+    async def recent(self):
+        await self._ensure_warm()
+        return list(self._messages)
+
+    async def _ensure_warm(self):
+        if self._warm:
+            return
+        latest = [
+            serialize_message(message)
+            async for message in ChatMessage.objects.select_related('author').order_by('-id')[:self.size]
+        ]
+        # Concurrent warm-ups or messages appended while loading are merged
+        # by id, so the buffer never holds duplicates.
+        known = {message['id'] for message in self._messages}
+        backlog = [message for message in reversed(latest) if message['id'] not in known]
+        self._messages = deque(backlog + list(self._messages), maxlen=self.size)
+        self._warm = True
+
+
+class RedisChatHistory:
+    """Ring buffer in a Redis list shared by every worker (LPUSH + LTRIM)."""
+
+    def __init__(self, url, size=50, key='chat:history'):
+        import redis.asyncio as redis
+
+        self.size = size
+        self.key = key
+        self._redis = redis.from_url(url)
+
+    async def append(self, message):
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.lpush(self.key, json.dumps(message))
+            pipe.ltrim(self.key, 0, self.size - 1)
+            await pipe.execute()
+
+    async def recent(self):
+        raw = await self._redis.lrange(self.key, 0, self.size - 1)
+        return [json.loads(item) for item in reversed(raw)]
+
+
+async def older_messages(before_id, limit=50):
+    """Page further back than the ring buffer with an indexed primary-key range scan.
+
+    Returns ``(messages oldest first, has_more)``.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    rows = [
+        message
+        async for message in ChatMessage.objects.select_related('author')
+        .filter(id__lt=before_id).order_by('-id')[:limit + 1]
+    ]
+    has_more = len(rows) > limit
+    return [serialize_message(message) for message in reversed(rows[:limit])], has_more
+
+
+def _build_history():
+    config = getattr(settings, 'CHAT_HISTORY', {})
+    size = config.get('SIZE', 50)
+    if config.get('BACKEND', 'local') == 'redis':
+        return RedisChatHistory(config['REDIS_URL'], size=size)
+    return LocalChatHistory(size=size)
+
+
+chat_history = _build_history()
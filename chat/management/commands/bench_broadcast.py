@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+
+from chat.broadcast import build_frame
+from chat.consumers import ChatConsumer
+
+SAMPLE_REPLY = {
+    'id': 123456,
+    'content': 'Sounds good to me, I will pick this up after lunch. ' * 3,
+    'thread_id': 4242,
+    'author': 'some_user',
+    'created_at': '2025-11-21 14:01:00.000000+00:00',
+}
+
+
+async def _discard(message):
+    pass
+
+
+def _connected_consumer():
+    """A ChatConsumer with its send queue and writer running, writing to nowhere."""
+    consumer = ChatConsumer()
+    consumer.base_send = _discard
+    consumer.init_connection_state()
+    consumer.writer_task = asyncio.create_task(consumer.drain_send_queue())
+    return consumer
+
+
+async def _drained(consumers):
+    while any(len(consumer.send_queue) for consumer in consumers):
+        await asyncio.sleep(0)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare CPU time per broadcast for per-recipient JSON encoding versus pre-encoded frames, "
+        "each through the consumer's handler, send queue and writer."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, nargs='+', default=[10, 100, 1000, 5000])
+        parser.add_argument('--broadcasts', type=int, default=200)
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options['clients'], options['broadcasts']))
+
+    async def run(self, client_counts, broadcasts):
+        self.stdout.write(f"{'clients':>8} {'per-recipient us':>18} {'pre-encoded us':>16} {'speedup':>8}")
+        for count in client_counts:
+            consumers = [_connected_consumer() for _ in range(count)]
+
+            start = time.process_time()
+            for _ in range(broadcasts):
+                event = {'type': 'new_reply_message', 'reply': SAMPLE_REPLY}
+                for consumer in consumers:
+                    await consumer.new_reply_message(event)
+                await _drained(consumers)
+            per_recipient = (time.process_time() - start) / broadcasts
+
+            start = time.process_time()
+            for seq in range(1, broadcasts + 1):
+                event = {
+                    'type': 'forward_frame',
+                    'frame': build_frame('new_reply', 'reply', SAMPLE_REPLY, seq),
+                    'epoch': 'bench',
+                    'seq': seq,
+                }
+                for consumer in consumers:
+                    await consumer.forward_frame(event)
+                await _drained(consumers)
+            pre_encoded = (time.process_time() - start) / broadcasts
+
+            for consumer in consumers:
+                consumer.writer_task.cancel()
+            self.stdout.write(
+                f"{count:>8} {per_recipient * 1e6:>18.1f} {pre_encoded * 1e6:>16.1f} "
+                f"{per_recipient / pre_encoded:>7.1f}x"
+            )
@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+from channels.db import database_sync_to_async
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from chat.consumers import ChatConsumer
+from chat.models import Category, ChatMessage, Reply, Thread
+from chat.notifications import notify
+from chat.ranking import record_reply
+
+
+class LegacyWrites:
+    """The consumer write paths as they were before the async ORM move:
+    one database_sync_to_async hop each, model instances handed back to
+    async code and read through related attributes."""
+
+    @database_sync_to_async
+    def create_thread(self, title, content, category_id, user):
+        category = Category.objects.get(id=category_id) if category_id else None
+        return Thread.objects.create(title=title, content=content, author=user, category=category)
+
+    @database_sync_to_async
+    def create_reply(self, thread_id, content, user):
+        thread = Thread.objects.get(id=thread_id)
+        reply = Reply.objects.create(thread=thread, content=content, author=user)
+        record_reply(thread.id, reply.created_at)
+        if thread.author != user:
+            notify(thread.author, f"{user.username} replied to your thread '{thread.title}'", thread=thread, reply=reply)
+        return reply
+
+    @database_sync_to_async
+    def create_chat_message(self, content, user):
+        message = ChatMessage.objects.create(content=content, author=user)
+        return {'id': message.id, 'author': message.author.username}
+
+
+async def _discard(message):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Events per second through the ChatConsumer write paths under concurrent load, "
+        "legacy sync-hop implementation versus the current one. Runs against a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--events', type=int, default=20, help="Events per concurrent client.")
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            asyncio.run(self.run(options['concurrency'], options['events']))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    async def run(self, concurrency, events):
+        author, replier, category, thread = await database_sync_to_async(self.seed)()
+
+        current = ChatConsumer()
+        current.base_send = _discard
+        legacy = LegacyWrites()
+
+        paths = {
+            'chat_message': lambda impl: impl.create_chat_message('hello', replier),
+            'reply': lambda impl: impl.create_reply(thread.id, 'a reply', replier),
+            'thread': lambda impl: impl.create_thread('title', 'body', category.id, author),
+        }
+
+        self.stdout.write(f"{'path':<14} {'legacy ev/s':>12} {'current ev/s':>13}")
+        for name, call in paths.items():
+            rates = []
+            for impl in (legacy, current):
+                async def client():
+                    for _ in range(events):
+                        result = await call(impl)
+                        if isinstance(result, Reply):
+                            # What the old receive() did with the result
+                            await database_sync_to_async(lambda: (result.thread.id, result.author.username))()
+                start = time.perf_counter()
+                await asyncio.gather(*[client() for _ in range(concurrency)])
+                rates.append(concurrency * events / (time.perf_counter() - start))
+            self.stdout.write(f"{name:<14} {rates[0]:>12.0f} {rates[1]:>13.0f}")
+
+    def seed(self):
+        author = User.objects.create(username='bench_author')
+        replier = User.objects.create(username='bench_replier')
+        category = Category.objects.create(name='bench')
+        thread = Thread.objects.create(title='bench', content='bench', author=author, category=category)
+        return author, replier, category, thread
@@ -0,0 +1,133 @@
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection
+
+from chat.models import Category, Reply, Thread
+from chat.ranking import record_reply, sort_threads
+from chat.votes import cast_vote
+
+PROFILES = ('development', 'production')
+
+
+def _percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Concurrent read/write load on a temporary SQLite file: thread listings against the vote and reply "
+        "paths, once per DJANGO_DB_PROFILE. Each profile runs in its own process so settings are built from "
+        "the environment exactly as in production."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--profiles', nargs='+', choices=PROFILES, default=list(PROFILES))
+        parser.add_argument('--worker', action='store_true', help="Internal: run one profile in this process.")
+
+    def handle(self, *args, **options):
+        if options['worker']:
+            self.stdout.write(json.dumps(self.work(options['readers'], options['writers'], options['seconds'])))
+            return
+
+        self.stdout.write(
+            f"{'profile':>12} {'path':>8} {'ops/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'locked':>7}"
+        )
+        for profile in options['profiles']:
+            with tempfile.TemporaryDirectory() as directory:
+                env = {
+                    **os.environ,
+                    'DJANGO_DB_PROFILE': profile,
+                    'SQLITE_PATH': str(Path(directory) / 'bench.sqlite3'),
+                }
+                output = subprocess.run(
+                    [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'bench_sqlite', '--worker',
+                     '--readers', str(options['readers']), '--writers', str(options['writers']),
+                     '--seconds', str(options['seconds'])],
+                    env=env, check=True, capture_output=True, text=True,
+                ).stdout
+            for path, stats in json.loads(output.strip().splitlines()[-1]).items():
+                self.stdout.write(
+                    f"{profile:>12} {path:>8} {stats['ops'] / options['seconds']:>8.0f} "
+                    f"{stats['p50'] * 1000:>8.1f} {stats['p99'] * 1000:>8.1f} {stats['locked']:>7}"
+                )
+
+    def seed(self):
+        call_command('migrate', verbosity=0)
+        users = User.objects.bulk_create([User(username=f'bench{i}') for i in range(50)])
+        category = Category.objects.create(name='Bench')
+        for i in range(200):
+            Thread.objects.create(title=f'Thread {i}', content='body ' * 40, author=users[i % 50], category=category)
+        return list(User.objects.all()), list(Thread.objects.values_list('id', flat=True))
+
+    def work(self, readers, writers, seconds):
+        users, thread_ids = self.seed()
+        connection.close()
+        stats = {path: {'latencies': [], 'locked': 0} for path in ('list', 'vote', 'reply')}
+        lock = threading.Lock()
+        deadline = time.monotonic() + seconds
+
+        def listing(rng):
+            threads, _sort = sort_threads(Thread.objects.select_related('author', 'category'), rng.choice(['new', 'hot']))
+            list(threads.prefetch_related('replies__author')[:10])
+
+        def vote(rng):
+            cast_vote('thread', rng.choice(thread_ids), rng.choice([1, -1]), rng.choice(users))
+
+        def reply(rng):
+            reply = Reply.objects.create(thread_id=rng.choice(thread_ids), content='a reply', author=rng.choice(users))
+            record_reply(reply.thread_id, reply.created_at)
+
+        def loop(seed, operations):
+            rng = random.Random(seed)
+            while time.monotonic() < deadline:
+                path, operation = rng.choice(operations)
+                start = time.perf_counter()
+                try:
+                    operation(rng)
+                except OperationalError:
+                    with lock:
+                        stats[path]['locked'] += 1
+                else:
+                    with lock:
+                        stats[path]['latencies'].append(time.perf_counter() - start)
+                # What the request_finished signal does after every request.
+                close_old_connections()
+            connection.close()
+
+        workers = [threading.Thread(target=loop, args=(i, [('list', listing)])) for i in range(readers)]
+        workers += [
+            threading.Thread(target=loop, args=(1000 + i, [('vote', vote), ('reply', reply)]))
+            for i in range(writers)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        return {
+            path: {
+                'ops': len(data['latencies']),
+                'p50': _percentile(data['latencies'], 0.5),
+                'p99': _percentile(data['latencies'], 0.99),
+                'locked': data['locked'],
+            }
+            for path, data in stats.items()
+        }
@@ -0,0 +1,114 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat import wire
+from chat.broadcast import frame_message
+
+WORDS = (
+    'the thread reply vote forum django channel socket message update works fine for me '
+    'could you share the traceback please thanks this fixed it after upgrading again'
+).split()
+
+MIXES = {
+    'chat': {'new_chat_message': 9, 'vote_update': 1},
+    'forum': {'new_thread': 1, 'new_reply': 4, 'vote_update': 4, 'notification': 1},
+    'votes': {'vote_update': 1},
+}
+
+
+def _text(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def sample_message(kind, rng, seq):
+    created_at = f'2025-11-21T14:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}.{rng.randint(0, 999999):06d}+00:00'
+    author = f'user{rng.randint(1, 5000)}'
+    if kind == 'new_chat_message':
+        return frame_message(kind, 'message', {
+            'id': rng.randint(1, 10 ** 6), 'content': _text(rng, 2, 25),
+            'author': author, 'created_at': created_at,
+        }, seq)
+    if kind == 'new_thread':
+        return frame_message(kind, 'thread', {
+            'id': rng.randint(1, 10 ** 5), 'title': _text(rng, 3, 10), 'content': _text(rng, 20, 120),
+            'author': author, 'category': 'General', 'created_at': created_at,
+        }, seq)
+    if kind == 'new_reply':
+        return frame_message(kind, 'reply', {
+            'id': rng.randint(1, 10 ** 6), 'content': _text(rng, 5, 60), 'thread_id': rng.randint(1, 10 ** 5),
+            'author': author, 'created_at': created_at,
+        }, seq)
+    if kind == 'vote_update':
+        return frame_message(kind, 'vote', {
+            'model_type': rng.choice(['thread', 'reply']), 'object_id': rng.randint(1, 10 ** 6),
+            'vote_count': rng.randint(-20, 400), 'user_vote': rng.choice([1, -1, None]),
+        }, seq)
+    return {
+        'type': 'notification',
+        'notification': {
+            'id': rng.randint(1, 10 ** 6), 'message': f'{author} replied to your thread',
+            'thread_id': rng.randint(1, 10 ** 5), 'reply_id': rng.randint(1, 10 ** 6), 'created_at': created_at,
+        },
+        'unread_count': rng.randint(0, 30),
+    }
+
+
+def _json(message):
+    return json.dumps(message).encode()
+
+
+def _msgpack(message):
+    return wire.encode_frame(wire.pack(message))
+
+
+def _msgpack_deflate(message):
+    return wire.encode_frame(wire.pack(message), compress=True)
+
+
+class Command(BaseCommand):
+    help = "Compare bytes on the wire and encode time of the JSON and msgpack WebSocket protocols."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=5000)
+        parser.add_argument('--batch', type=int, default=20, help="Events per frame in the batched rows.")
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if wire.msgpack is None:
+            raise CommandError('msgpack is not installed.')
+        encoders = [('json', _json), ('msgpack', _msgpack), ('msgpack+deflate', _msgpack_deflate)]
+        batch = options['batch']
+
+        self.stdout.write(f"{'mix':>6} {'encoding':>16} {'bytes/event':>12} {'vs json':>8} "
+                          f"{'encode us':>10} {'batched b/event':>16}")
+        for mix, weights in MIXES.items():
+            rng = random.Random(options['seed'])
+            kinds = rng.choices(list(weights), weights=list(weights.values()), k=options['events'])
+            messages = [sample_message(kind, rng, seq) for seq, kind in enumerate(kinds, 1)]
+            baseline = None
+            for name, encode in encoders:
+                start = time.perf_counter()
+                sizes = [len(encode(message)) for message in messages]
+                elapsed = time.perf_counter() - start
+                per_event = sum(sizes) / len(messages)
+                baseline = baseline or per_event
+                batched = self.batched_size(name, messages, batch) / len(messages)
+                self.stdout.write(
+                    f"{mix:>6} {name:>16} {per_event:>12.1f} {per_event / baseline:>7.0%} "
+                    f"{elapsed / len(messages) * 1e6:>10.2f} {batched:>16.1f}"
+                )
+
+    def batched_size(self, name, messages, batch):
+        """Bytes for the same events delivered in arrays of ``batch``, as set_batching sends them."""
+        total = 0
+        for start in range(0, len(messages), batch):
+            chunk = messages[start:start + batch]
+            if name == 'json':
+                total += len(('[' + ','.join(json.dumps(message) for message in chunk) + ']').encode())
+            else:
+                packed = wire.pack_array([wire.pack(message) for message in chunk])
+                total += len(wire.encode_frame(packed, compress=name == 'msgpack+deflate'))
+        return total
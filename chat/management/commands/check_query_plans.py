@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import get_runner
+
+
+class Command(BaseCommand):
+    help = (
+        "Run chat.tests.QueryPlanTests: EXPLAIN QUERY PLAN on every query the thread listings, notifications "
+        "and vote paths issue, failing on full-table scans, unindexed sorts and lost indexes. "
+        "`manage.py test` runs the same test."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--show-plans', action='store_true', help="Print every plan, not only failures.")
+
+    def handle(self, *args, **options):
+        from chat.tests import QueryPlanTests
+
+        QueryPlanTests.show_plans = options['show_plans']
+        runner = get_runner(settings)(verbosity=options['verbosity'], interactive=False)
+        if runner.run_tests(['chat.tests.QueryPlanTests']):
+            raise CommandError("Query plan problems; see the test output above.")
+        self.stdout.write(self.style.SUCCESS("All query plans use indexes."))
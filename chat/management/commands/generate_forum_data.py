@@ -0,0 +1,288 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from chat.models import Category, ChatMessage, Notification, Reply, Thread, UserProfile, Vote
+from chat.ranking import hot_score
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ra', 'to', 'su', 'vi', 'de', 'an', 'or', 'el', 'is', 'um', 'py', 'th', 'on', 'ex']
+DAY = 86400
+
+
+def zipf_cum_weights(n, exponent, rng):
+    """Cumulative weights giving item ``i`` a Zipf share by a random popularity rank.
+
+    Ranks are shuffled so popularity doesn't follow id (or age) order.
+    """
+    ranks = list(range(1, n + 1))
+    rng.shuffle(ranks)
+    return list(accumulate(1 / rank ** exponent for rank in ranks))
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let ``bulk_create`` keep generated ``created_at`` values instead of stamping now."""
+    fields = [model._meta.get_field('created_at') for model in models]
+    fields = [field for field in fields if field.auto_now_add]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a seeded synthetic forum: users, categories, threads, replies, votes, "
+        "notifications and chat messages. Activity per thread, reply and user follows a Zipf distribution. "
+        "The same options and --seed always produce the same rows, dated relative to when the command runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--threads', type=int, default=50_000)
+        parser.add_argument('--replies', type=int, default=500_000)
+        parser.add_argument('--votes', type=int, default=1_000_000)
+        parser.add_argument('--chat-messages', type=int, default=200_000)
+        parser.add_argument('--days', type=int, default=365, help="Spread activity over this many days up to now.")
+        parser.add_argument('--zipf', type=float, default=1.1, help="Zipf exponent for per-thread and per-user activity.")
+        parser.add_argument('--thread-vote-share', type=float, default=0.3, help="Fraction of votes on threads rather than replies.")
+        parser.add_argument('--read-fraction', type=float, default=0.9, help="Fraction of notifications already read.")
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='synthetic', help="Username and category name prefix.")
+        parser.add_argument('--password', default='password', help="Password of every generated user.")
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['categories'] < 1 or options['threads'] < 1:
+            raise CommandError("--users, --categories and --threads must be at least 1.")
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(f"Users named {prefix}* already exist; use an empty database or another --prefix.")
+
+        self.options = options
+        self.batch_size = options['batch_size']
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        self.start = (self.now - timedelta(days=options['days'])).timestamp()
+        self.vocabulary = [
+            ''.join(self.rng.choices(SYLLABLES, k=self.rng.randint(1, 4))) for _ in range(5000)
+        ]
+        self.word_weights = zipf_cum_weights(len(self.vocabulary), 1.0, self.rng)
+        started = time.perf_counter()
+
+        with explicit_timestamps(Category, Thread, Reply, Vote, Notification):
+            users = self.users = self.step('users', self.create_users)
+            categories = self.step('categories', self.create_categories)
+            threads, replies, thread_votes, reply_votes = self.plan(users)
+            thread_ids = self.step('threads', self.create_threads, threads, categories, thread_votes, replies)
+            reply_ids = self.step('replies', self.create_replies, replies, thread_ids, reply_votes)
+            self.step('votes', self.create_votes, thread_votes, reply_votes, thread_ids, reply_ids)
+            self.step('notifications', self.create_notifications, replies, threads, thread_ids, reply_ids)
+            self.step('chat messages', self.create_chat_messages, users)
+
+        self.stdout.write(self.style.SUCCESS(f"Generated the dataset in {time.perf_counter() - started:.0f} s."))
+
+    def step(self, name, function, *args):
+        started = time.perf_counter()
+        with transaction.atomic():
+            result = function(*args)
+        count = len(result) if isinstance(result, list) else result
+        self.stdout.write(f"{name}: {count} rows in {time.perf_counter() - started:.1f} s")
+        return result
+
+    def words(self, low, high):
+        return ' '.join(self.rng.choices(self.vocabulary, cum_weights=self.word_weights, k=self.rng.randint(low, high)))
+
+    def at(self, timestamp):
+        return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+    def later(self, timestamp, mean_seconds):
+        """A time after ``timestamp``, usually soon after, never in the future."""
+        now = self.now.timestamp()
+        later = timestamp + self.rng.expovariate(1 / mean_seconds)
+        return later if later < now else self.rng.uniform(timestamp, now)
+
+    def bulk_create(self, model, objects):
+        """Insert ``objects`` (any iterable, built lazily) in batches; returns their ids in order."""
+        objects = iter(objects)
+        ids = []
+        while batch := list(islice(objects, self.batch_size)):
+            ids.extend(obj.pk for obj in model.objects.bulk_create(batch))
+        return ids
+
+    def create_users(self):
+        password = make_password(self.options['password'])
+        rng, prefix = self.rng, self.options['prefix']
+        users = [
+            User(username=f'{prefix}{i}', password=password,
+                 date_joined=self.at(rng.uniform(self.start, self.now.timestamp())))
+            for i in range(self.options['users'])
+        ]
+        ids = self.bulk_create(User, users)
+        self.bulk_create(UserProfile, [UserProfile(user_id=user_id, last_seen=self.now) for user_id in ids])
+        return ids
+
+    def create_categories(self):
+        prefix = self.options['prefix']
+        return self.bulk_create(Category, [
+            Category(name=f'{prefix} {i} {self.words(1, 2)}', description=self.words(5, 20), created_at=self.at(self.start))
+            for i in range(self.options['categories'])
+        ])
+
+    def plan(self, users):
+        """Decide who posts and votes on what, and when, before writing anything.
+
+        Threads and replies are listed in time order (so ids grow with
+        ``created_at``, as in production), and their vote, reply and
+        activity counters are known up front and written with the rows.
+        """
+        rng, options = self.rng, self.options
+        started = time.perf_counter()
+        user_weights = zipf_cum_weights(len(users), options['zipf'], rng)
+        user_indexes = range(len(users))
+
+        # threads: (created_at, author)
+        thread_times = sorted(rng.uniform(self.start, self.now.timestamp()) for _ in range(options['threads']))
+        thread_authors = rng.choices(user_indexes, cum_weights=user_weights, k=len(thread_times))
+        threads = list(zip(thread_times, thread_authors))
+
+        # replies: (created_at, thread, author), mostly within a day or so of their thread
+        thread_weights = zipf_cum_weights(len(threads), options['zipf'], rng)
+        reply_threads = rng.choices(range(len(threads)), cum_weights=thread_weights, k=options['replies'])
+        reply_authors = rng.choices(user_indexes, cum_weights=user_weights, k=len(reply_threads))
+        replies = sorted(
+            (self.later(threads[thread][0], DAY), thread, author)
+            for thread, author in zip(reply_threads, reply_authors)
+        )
+
+        # votes: {(user, target): (vote_type, created_at)}, at most one per user and target
+        thread_votes, reply_votes = {}, {}
+        reply_weights = zipf_cum_weights(len(replies), options['zipf'], rng) if replies else None
+        share = options['thread_vote_share'] if replies else 1
+        wanted = options['votes']
+        attempts = 0
+        while len(thread_votes) + len(reply_votes) < wanted and attempts < 3 * wanted:
+            chunk = min(100_000, wanted - len(thread_votes) - len(reply_votes))
+            attempts += chunk
+            on_threads = int(chunk * share)
+            voters = rng.choices(user_indexes, cum_weights=user_weights, k=chunk)
+            targets = rng.choices(range(len(threads)), cum_weights=thread_weights, k=on_threads)
+            if replies:
+                targets += rng.choices(range(len(replies)), cum_weights=reply_weights, k=chunk - on_threads)
+            for position, (voter, target) in enumerate(zip(voters, targets)):
+                if position < on_threads:
+                    votes, created = thread_votes, threads[target][0]
+                else:
+                    votes, created = reply_votes, replies[target][0]
+                if (voter, target) not in votes:
+                    votes[(voter, target)] = (Vote.UPVOTE if rng.random() < 0.8 else Vote.DOWNVOTE, self.later(created, DAY / 4))
+        if len(thread_votes) + len(reply_votes) < wanted:
+            self.stderr.write(
+                f"Only {len(thread_votes) + len(reply_votes)} distinct votes fit; use more users or fewer votes."
+            )
+        self.stdout.write(f"plan: {time.perf_counter() - started:.1f} s")
+        return threads, replies, thread_votes, reply_votes
+
+    def tally(self, votes, count):
+        """``[(upvotes, downvotes)]`` per target index."""
+        up, down = [0] * count, [0] * count
+        for (_voter, target), (vote_type, _created) in votes.items():
+            if vote_type == Vote.UPVOTE:
+                up[target] += 1
+            else:
+                down[target] += 1
+        return list(zip(up, down))
+
+    def create_threads(self, threads, categories, votes, replies):
+        rng = self.rng
+        reply_counts = [0] * len(threads)
+        last_activity = [created for created, _author in threads]
+        for created, thread, _author in replies:
+            reply_counts[thread] += 1
+            last_activity[thread] = max(last_activity[thread], created)
+        category_weights = zipf_cum_weights(len(categories), 1.0, rng)
+        category_ids = rng.choices(categories, cum_weights=category_weights, k=len(threads))
+
+        self.titles = [self.words(3, 10).capitalize() for _ in threads]
+
+        def objects():
+            for index, ((created, author), (up, down)) in enumerate(zip(threads, self.tally(votes, len(threads)))):
+                created_at = self.at(created)
+                yield Thread(
+                    title=self.titles[index],
+                    content=self.words(20, 200),
+                    author_id=self.users[author],
+                    category_id=category_ids[index],
+                    created_at=created_at,
+                    score=up - down, upvotes=up, downvotes=down,
+                    reply_count=reply_counts[index],
+                    last_activity_at=self.at(last_activity[index]),
+                    hot_score=hot_score(up - down, reply_counts[index], created_at),
+                )
+        return self.bulk_create(Thread, objects())
+
+    def create_replies(self, replies, thread_ids, votes):
+        return self.bulk_create(Reply, (
+            Reply(
+                content=self.words(5, 60),
+                thread_id=thread_ids[thread],
+                author_id=self.users[author],
+                created_at=self.at(created),
+                score=up - down, upvotes=up, downvotes=down,
+            )
+            for (created, thread, author), (up, down) in zip(replies, self.tally(votes, len(replies)))
+        ))
+
+    def create_votes(self, thread_votes, reply_votes, thread_ids, reply_ids):
+        created = 0
+        for model, votes, ids in ((Thread, thread_votes, thread_ids), (Reply, reply_votes, reply_ids)):
+            content_type = ContentType.objects.get_for_model(model)
+            created += len(self.bulk_create(Vote, (
+                Vote(content_type_id=content_type.id, object_id=ids[target], user_id=self.users[voter],
+                     vote_type=vote_type, created_at=self.at(created_at))
+                for (voter, target), (vote_type, created_at) in votes.items()
+            )))
+        return created
+
+    def create_notifications(self, replies, threads, thread_ids, reply_ids):
+        # What create_reply does: notify the thread's author of every reply by someone else.
+        prefix = self.options['prefix']
+        read_fraction = self.options['read_fraction']
+
+        def objects():
+            for index, (created, thread, author) in enumerate(replies):
+                recipient = threads[thread][1]
+                if recipient == author:
+                    continue
+                yield Notification(
+                    user_id=self.users[recipient],
+                    message=f"{prefix}{author} replied to your thread '{self.titles[thread]}'"[:255],
+                    is_read=self.rng.random() < read_fraction,
+                    created_at=self.at(created),
+                    thread_id=thread_ids[thread],
+                    reply_id=reply_ids[index],
+                )
+        return self.bulk_create(Notification, objects())
+
+    def create_chat_messages(self, users):
+        rng = self.rng
+        weights = zipf_cum_weights(len(users), self.options['zipf'], rng)
+        times = sorted(rng.uniform(self.start, self.now.timestamp()) for _ in range(self.options['chat_messages']))
+        authors = rng.choices(users, cum_weights=weights, k=len(times))
+        return self.bulk_create(ChatMessage, (
+            ChatMessage(content=self.words(1, 25), author_id=author, created_at=self.at(created))
+            for created, author in zip(times, authors)
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from chat.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Create the SQLite FTS5 search index if needed and repopulate it from threads and replies."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        if not rebuild_search_index(using=options['database']):
+            raise CommandError("FTS5 is not available on this database; search falls back to LIKE queries.")
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from chat.votes import rebuild_vote_counters
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored score/upvotes/downvotes of threads and replies from the Vote table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = rebuild_vote_counters(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt vote counters for {updated} objects."))
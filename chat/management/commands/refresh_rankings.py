@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from chat.ranking import refresh_rankings
+
+
+class Command(BaseCommand):
+    help = "Recompute every thread's reply count, last activity and hot score. Meant to run periodically (e.g. from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = refresh_rankings(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Refreshed rankings for {updated} threads."))
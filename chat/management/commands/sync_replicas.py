@@ -0,0 +1,41 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database onto every replica in SQLITE_REPLICAS using SQLite's online backup, "
+        "which takes a consistent snapshot while the primary keeps accepting writes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help="Keep copying every N seconds instead of once. Keep it below DB_REPLICA_PIN_SECONDS.",
+        )
+
+    def handle(self, *args, **options):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas:
+            raise CommandError("No replicas configured; set SQLITE_REPLICAS.")
+        if connections[DEFAULT_DB_ALIAS].vendor != 'sqlite':
+            raise CommandError("sync_replicas only copies SQLite databases.")
+
+        source = connections[DEFAULT_DB_ALIAS]
+        while True:
+            source.ensure_connection()
+            for alias in replicas:
+                start = time.perf_counter()
+                target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+                try:
+                    source.connection.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(f"{alias}: copied in {(time.perf_counter() - start) * 1000:.0f} ms")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,27 @@
+import threading
+from collections import Counter
+
+# Process-local counters for the real-time layer (dropped frames, throttled
+# events, ...). Scraped as JSON from the metrics view.
+
+_counters = Counter()
+_lock = threading.Lock()
+_gauges = {}
+
+
+def increment(name, amount=1):
+    with _lock:
+        _counters[name] += amount
+
+
+def register_gauge(name, func):
+    """Register ``func()`` to be evaluated whenever a snapshot is taken."""
+    _gauges[name] = func
+
+
+def snapshot():
+    with _lock:
+        data = dict(_counters)
+    for name, func in _gauges.items():
+        data[name] = func()
+    return data
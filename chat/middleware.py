@@ -1,5 +1,4 @@
-from django.utils import timezone
-from .models import UserProfile
+from .presence import presence_tracker
 
 class UpdateLastSeenMiddleware:
     def __init__(self, get_response):
@@ -7,7 +6,5 @@ class UpdateLastSeenMiddleware:
 
     def __call__(self, request):
         if request.user.is_authenticated:
-            UserProfile.objects.filter(user=request.user).update(
-                last_seen=timezone.now()
-            )
+            presence_tracker.touch(request.user.id)
         return self.get_response(request)
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:40
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_vote_counters(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Vote = apps.get_model('chat', 'Vote')
+    for model_name in ('thread', 'reply'):
+        model = apps.get_model('chat', model_name)
+        content_type = ContentType.objects.filter(app_label='chat', model=model_name).first()
+        if content_type is None:
+            continue
+        grouped = (
+            Vote.objects.filter(content_type=content_type)
+            .values('object_id')
+            .annotate(up=Count('id', filter=Q(vote_type=1)), down=Count('id', filter=Q(vote_type=-1)))
+            .order_by()
+        )
+        objs = [
+            model(id=row['object_id'], upvotes=row['up'], downvotes=row['down'], score=row['up'] - row['down'])
+            for row in grouped
+        ]
+        model.objects.bulk_update(objs, ['upvotes', 'downvotes', 'score'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_remove_userprofile_join_date_and_more'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reply',
+            name='downvotes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='reply',
+            name='score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='reply',
+            name='upvotes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='downvotes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='upvotes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_vote_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from chat.search import create_search_index, rebuild_search_index
+
+    if create_search_index(schema_editor.connection):
+        rebuild_search_index(using=schema_editor.connection.alias)
+
+
+def drop_search_index(apps, schema_editor):
+    from chat.search import drop_search_index
+
+    drop_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_vote_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:59
+
+import chat.ranking
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def backfill_rankings(apps, schema_editor):
+    from chat.ranking import hot_score
+
+    Thread = apps.get_model('chat', 'Thread')
+    Reply = apps.get_model('chat', 'Reply')
+    replies = {
+        row['thread_id']: (row['count'], row['latest'])
+        for row in Reply.objects.values('thread_id').annotate(count=Count('id'), latest=Max('created_at')).order_by()
+    }
+    threads = list(Thread.objects.only('id', 'created_at', 'score'))
+    for thread in threads:
+        thread.reply_count, latest = replies.get(thread.id, (0, None))
+        thread.last_activity_at = max(thread.created_at, latest) if latest else thread.created_at
+        thread.hot_score = hot_score(thread.score, thread.reply_count, thread.created_at)
+    Thread.objects.bulk_update(threads, ['reply_count', 'last_activity_at', 'hot_score'], batch_size=1000)
+
+
+def restore_search_triggers(apps, schema_editor):
+    # Adding or removing chat_thread columns makes SQLite rebuild the table,
+    # which drops the FTS sync triggers created in 0007.
+    from chat.search import create_search_index, rebuild_search_index
+
+    if create_search_index(schema_editor.connection):
+        rebuild_search_index(using=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_chatmessage_created_at_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='thread',
+            name='hot_score',
+            field=models.FloatField(default=chat.ranking.initial_hot_score),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rankings, migrations.RunPython.noop),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['-hot_score', '-id'], name='chat_thread_hot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['-score', '-id'], name='chat_thread_top_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['-last_activity_at', '-id'], name='chat_thread_active_idx'),
+        ),
+    ]
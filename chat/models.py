@@ -1,10 +1,12 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 from django.contrib.contenttypes.models import ContentType
 from django.utils import timezone
 from datetime import timedelta
 
+from .ranking import initial_hot_score
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
@@ -14,7 +16,13 @@ class UserProfile(models.Model):
     last_seen = models.DateTimeField(default=timezone.now)
 
     def is_online(self):
-        return self.last_seen >= timezone.now() - timedelta(minutes=2)
+        from .online import online_registry
+        from .presence import presence_tracker
+
+        if online_registry.is_online(self.user_id):
+            return True
+        last_seen = max(self.last_seen, presence_tracker.last_seen(self.user_id) or self.last_seen)
+        return last_seen >= timezone.now() - timedelta(minutes=2)
 
     def __str__(self):
         return self.user.username
@@ -35,13 +43,35 @@ class Thread(models.Model):
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Denormalized vote counters, kept in step with Vote by chat.votes.cast_vote
+    score = models.IntegerField(default=0)
+    upvotes = models.PositiveIntegerField(default=0)
+    downvotes = models.PositiveIntegerField(default=0)
+
+    # Ranking inputs and the precomputed "hot" rank, maintained by chat.ranking
+    reply_count = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(default=timezone.now)
+    hot_score = models.FloatField(default=initial_hot_score)
+
+    votes = GenericRelation('Vote')
+
+    class Meta:
+        indexes = [
+            # Keyset pagination walks threads newest first by (created_at, id)
+            models.Index(fields=['-created_at', '-id'], name='chat_thread_recent_idx'),
+            # ... and the same within one category
+            models.Index(fields=['category', '-created_at', '-id'], name='chat_thread_cat_recent_idx'),
+            # One per listing sort mode (chat.ranking.sort_threads)
+            models.Index(fields=['-hot_score', '-id'], name='chat_thread_hot_idx'),
+            models.Index(fields=['-score', '-id'], name='chat_thread_top_idx'),
+            models.Index(fields=['-last_activity_at', '-id'], name='chat_thread_active_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
     def vote_count(self):
-        up_votes = self.votes.filter(vote_type=Vote.UPVOTE).count()
-        down_votes = self.votes.filter(vote_type=Vote.DOWNVOTE).count()
-        return up_votes - down_votes
+        return self.score
 
     def user_vote(self, user):
         try:
@@ -56,13 +86,18 @@ class Reply(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Denormalized vote counters, kept in step with Vote by chat.votes.cast_vote
+    score = models.IntegerField(default=0)
+    upvotes = models.PositiveIntegerField(default=0)
+    downvotes = models.PositiveIntegerField(default=0)
+
+    votes = GenericRelation('Vote')
+
     def __str__(self):
         return f"Reply to {self.thread.title}"
 
     def vote_count(self):
-        up_votes = self.votes.filter(vote_type=Vote.UPVOTE).count()
-        down_votes = self.votes.filter(vote_type=Vote.DOWNVOTE).count()
-        return up_votes - down_votes
+        return self.score
 
     def user_vote(self, user):
         try:
@@ -74,7 +109,9 @@ class Reply(models.Model):
 class ChatMessage(models.Model):
     content = models.TextField()
     author = models.ForeignKey(User, on_delete=models.CASCADE)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add: buffered writes stamp messages when they are sent,
+    # not when the batch reaches the database.
+    created_at = models.DateTimeField(default=timezone.now)
 
     def __str__(self):
         return f"{self.author.username}: {self.content[:50]}"
@@ -96,6 +133,11 @@ class Vote(models.Model):
 
     class Meta:
         unique_together = ['user', 'content_type', 'object_id']
+        indexes = [
+            # Every vote on one object (counter rebuilds, GenericRelation
+            # deletes); the unique index above leads with user.
+            models.Index(fields=['content_type', 'object_id', 'vote_type'], name='chat_vote_target_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} voted {self.get_vote_type_display()} on {self.content_object}"
@@ -108,5 +150,17 @@ class Notification(models.Model):
     thread = models.ForeignKey(Thread, on_delete=models.CASCADE, null=True, blank=True)
     reply = models.ForeignKey(Reply, on_delete=models.CASCADE, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Unread counts and mark-as-read updates
+            models.Index(fields=['user', 'is_read', '-created_at'], name='chat_notif_user_unread_idx'),
+            # The unread list in order. SQLite compiles is_read=False to
+            # NOT is_read, which the index above can't seek on.
+            models.Index(
+                fields=['user', '-created_at'], condition=models.Q(is_read=False),
+                name='chat_notif_unread_recent_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"Notification for {self.user.username}: {self.message}"
@@ -0,0 +1,73 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.db import transaction
+
+from .groups import user_group
+from .models import Notification
+
+UNREAD_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def unread_cache_key(user_id):
+    return f'chat:unread_notifications:{user_id}'
+
+
+def get_unread_count(user):
+    """Return the user's unread notification count, rebuilding the cache entry if missing."""
+    key = unread_cache_key(user.id)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(user=user, is_read=False).count()
+        cache.set(key, count, UNREAD_CACHE_TIMEOUT)
+    return count
+
+
+def increment_unread(user_id):
+    try:
+        cache.incr(unread_cache_key(user_id))
+    except ValueError:
+        # No cached value yet; the next read rebuilds it from the table.
+        pass
+
+
+def reset_unread(user_id):
+    cache.set(unread_cache_key(user_id), 0, UNREAD_CACHE_TIMEOUT)
+
+
+def notify(user, message, thread=None, reply=None):
+    """Create a notification for ``user`` and bump their cached unread count."""
+    notification = Notification.objects.create(
+        user=user,
+        message=message,
+        thread=thread,
+        reply=reply,
+    )
+    increment_unread(user.id)
+    transaction.on_commit(lambda: push_notification(notification))
+    return notification
+
+
+def notification_event(notification, unread_count):
+    return {
+        'type': 'notification_message',
+        'notification': {
+            'id': notification.id,
+            'message': notification.message,
+            'thread_id': notification.thread_id,
+            'reply_id': notification.reply_id,
+            'created_at': notification.created_at.isoformat(),
+        },
+        'unread_count': unread_count,
+    }
+
+
+def push_notification(notification):
+    """Send a notification and the new unread count to the user's open sockets."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(
+        user_group(notification.user_id),
+        notification_event(notification, get_unread_count(notification.user)),
+    )
@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+
+from django.conf import settings
+
+
+class OnlineRegistry:
+    """In-process registry of who currently has a live ChatConsumer socket.
+
+    Each socket is tracked separately, so a user with several tabs stays
+    online until the last one disconnects or stops heartbeating for
+    ``timeout`` seconds. Sockets are kept in heartbeat order, which makes
+    expiry an amortized O(1) sweep from the oldest end, and ``is_online`` /
+    ``count`` plain dict lookups.
+
+    The registry lives in the worker's memory; with several ASGI workers
+    each one only knows about its own sockets.
+    """
+
+    def __init__(self, timeout=90):
+        self.timeout = timeout
+        self._sockets = OrderedDict()  # channel_name -> (user_id, last_beat)
+        self._users = {}  # user_id -> number of live sockets
+        self._lock = threading.Lock()
+
+    def connect(self, user_id, channel_name):
+        with self._lock:
+            if channel_name not in self._sockets:
+                self._users[user_id] = self._users.get(user_id, 0) + 1
+            self._sockets[channel_name] = (user_id, time.monotonic())
+            self._sockets.move_to_end(channel_name)
+
+    def heartbeat(self, user_id, channel_name):
+        self.connect(user_id, channel_name)
+
+    def disconnect(self, user_id, channel_name):
+        with self._lock:
+            if self._sockets.pop(channel_name, None) is not None:
+                self._release(user_id)
+
+    def is_online(self, user_id):
+        with self._lock:
+            self._expire()
+            return user_id in self._users
+
+    def count(self):
+        with self._lock:
+            self._expire()
+            return len(self._users)
+
+    def online_user_ids(self, offset=0, limit=50):
+        """Return one page of online user ids, in the order they came online."""
+        with self._lock:
+            self._expire()
+            return list(islice(self._users, offset, offset + limit))
+
+    def _expire(self):
+        deadline = time.monotonic() - self.timeout
+        while self._sockets:
+            channel_name, (user_id, last_beat) = next(iter(self._sockets.items()))
+            if last_beat >= deadline:
+                break
+            del self._sockets[channel_name]
+            self._release(user_id)
+
+    def _release(self, user_id):
+        remaining = self._users.get(user_id, 0) - 1
+        if remaining > 0:
+            self._users[user_id] = remaining
+        else:
+            self._users.pop(user_id, None)
+
+
+online_registry = OnlineRegistry(timeout=getattr(settings, 'ONLINE_TIMEOUT', 90))
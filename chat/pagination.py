@@ -0,0 +1,124 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+DEFAULT_MODES = {
+    'index': 'auto',
+    'category_detail': 'auto',
+}
+
+# In "auto" mode a listing with at most this many threads keeps classic
+# page numbers; anything bigger switches to cursors.
+AUTO_CURSOR_THRESHOLD = 200
+
+
+def encode_cursor(thread, direction):
+    payload = json.dumps([direction, thread.created_at.isoformat(), thread.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return ``(direction, created_at, id)`` or None for a missing or malformed token."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, created_at, pk = json.loads(base64.urlsafe_b64decode(padded))
+        if direction not in ('next', 'prev'):
+            return None
+        return direction, datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        return None
+
+
+class CursorPage:
+    """A page of threads positioned by ``(created_at, id)`` instead of an OFFSET.
+
+    Mirrors the parts of ``django.core.paginator.Page`` the templates use, but
+    never counts the full result set.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def paginate_by_cursor(queryset, token, per_page):
+    """Return the CursorPage of ``queryset`` (newest first) that ``token`` points at."""
+    cursor = decode_cursor(token)
+    queryset = queryset.order_by('-created_at', '-id')
+
+    if cursor is None:
+        rows = list(queryset[:per_page + 1])
+        has_more, has_before = len(rows) > per_page, False
+        rows = rows[:per_page]
+    else:
+        direction, created_at, pk = cursor
+        if direction == 'next':
+            rows = list(queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            )[:per_page + 1])
+            has_more, has_before = len(rows) > per_page, True
+            rows = rows[:per_page]
+        else:
+            rows = list(queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+            ).order_by('created_at', 'id')[:per_page + 1])
+            has_before, has_more = len(rows) > per_page, True
+            rows = rows[:per_page][::-1]
+
+    if not rows:
+        return CursorPage([])
+    return CursorPage(
+        rows,
+        next_cursor=encode_cursor(rows[-1], 'next') if has_more else None,
+        previous_cursor=encode_cursor(rows[0], 'prev') if has_before else None,
+    )
+
+
+def pagination_mode(view_name, queryset):
+    """Resolve ``settings.FORUM_PAGINATION`` for a view to ``'page'`` or ``'cursor'``."""
+    modes = {**DEFAULT_MODES, **getattr(settings, 'FORUM_PAGINATION', {})}
+    mode = modes.get(view_name, 'page')
+    if mode == 'auto':
+        # Bounded count: never looks past the threshold.
+        small = queryset.values('id')[:AUTO_CURSOR_THRESHOLD + 1].count() <= AUTO_CURSOR_THRESHOLD
+        mode = 'page' if small else 'cursor'
+    return mode
+
+
+def paginate_threads(request, view_name, queryset, per_page=10, ordered_by_date=True):
+    """Paginate a thread listing in whichever mode the view is configured for.
+
+    A ``cursor`` parameter always selects cursor mode. Listings that are not
+    ordered by date (e.g. ranked search results) always use page numbers.
+    """
+    if ordered_by_date:
+        token = request.GET.get('cursor')
+        if token or pagination_mode(view_name, queryset) == 'cursor':
+            return paginate_by_cursor(queryset, token, per_page)
+    return Paginator(queryset, per_page).get_page(request.GET.get('page'))
@@ -0,0 +1,89 @@
+import atexit
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from .models import UserProfile
+
+# Keeps each UPDATE well under SQLite's bound-parameter limit; a normal
+# flush fits in one statement.
+FLUSH_BATCH_SIZE = 500
+
+
+class PresenceTracker:
+    """Write-behind store for ``UserProfile.last_seen``.
+
+    ``touch()`` only records a timestamp in memory, and skips even that when
+    the user's last recorded time is younger than ``throttle`` seconds.
+    A daemon thread, started by the first ``touch()``, writes pending
+    timestamps with a single UPDATE (one per 500 users) every
+    ``flush_interval`` seconds; whatever is left is written at interpreter
+    exit.
+    """
+
+    def __init__(self, throttle=60, flush_interval=30):
+        self.throttle = throttle
+        self.flush_interval = flush_interval
+        self._seen = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def touch(self, user_id, force=False):
+        now = timezone.now()
+        with self._lock:
+            previous = self._seen.get(user_id)
+            if not force and previous and (now - previous).total_seconds() < self.throttle:
+                return
+            self._seen[user_id] = now
+            self._pending[user_id] = now
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='presence-flush', daemon=True)
+                self._thread.start()
+
+    def last_seen(self, user_id):
+        return self._seen.get(user_id)
+
+    def flush(self):
+        """Write every pending timestamp in one statement. Returns the number of users written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        items = list(pending.items())
+        for start in range(0, len(items), FLUSH_BATCH_SIZE):
+            batch = items[start:start + FLUSH_BATCH_SIZE]
+            UserProfile.objects.filter(user_id__in=[user_id for user_id, _seen in batch]).update(
+                last_seen=Case(
+                    *[When(user_id=user_id, then=Value(seen)) for user_id, seen in batch],
+                    output_field=DateTimeField(),
+                )
+            )
+        return len(items)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing presence: {e}")
+                connection.close()
+
+
+presence_tracker = PresenceTracker(
+    throttle=getattr(settings, 'PRESENCE_WRITE_THROTTLE', 60),
+    flush_interval=getattr(settings, 'PRESENCE_FLUSH_INTERVAL', 30),
+)
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        presence_tracker.flush()
+    except Exception as e:
+        print(f"Error flushing presence: {e}")
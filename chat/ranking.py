@@ -0,0 +1,128 @@
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.utils import timezone
+
+# Ages are measured from here; any fixed instant works.
+RANKING_EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+SORT_MODES = ('new', 'hot', 'top', 'active')
+TOP_PERIODS = {
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+    'all': None,
+}
+
+
+def _setting(name, default):
+    return getattr(settings, 'RANKING', {}).get(name, default)
+
+
+def hot_score(score, reply_count, created_at):
+    """Rank of a thread for the "hot" listing.
+
+    Votes and replies (each reply worth ``REPLY_WEIGHT`` votes) count
+    logarithmically, and every ``DECAY_SECONDS`` of age is worth as much as
+    ten times the activity. Age enters as a constant head start for newer
+    threads, so the order is the same as decaying every score over time
+    while stored scores never need rewriting just because time passed.
+    """
+    activity = score + _setting('REPLY_WEIGHT', 2) * reply_count
+    order = math.log10(max(abs(activity), 1))
+    sign = (activity > 0) - (activity < 0)
+    age = (created_at - RANKING_EPOCH).total_seconds()
+    return round(sign * order + age / _setting('DECAY_SECONDS', 45000), 7)
+
+
+def initial_hot_score():
+    """Default ``Thread.hot_score``: a thread with no votes or replies, created now."""
+    return hot_score(0, 0, timezone.now())
+
+
+def refresh_hot_score(thread_id):
+    """Recompute one thread's stored ``hot_score`` from its stored counters.
+
+    Call it in the transaction that changed the counters, so the values read
+    back are the ones just written.
+    """
+    from .models import Thread
+
+    row = Thread.objects.filter(id=thread_id).values('score', 'reply_count', 'created_at').first()
+    if row is None:
+        return
+    Thread.objects.filter(id=thread_id).update(
+        hot_score=hot_score(row['score'], row['reply_count'], row['created_at'])
+    )
+
+
+def record_reply(thread_id, replied_at=None):
+    """Count a new reply towards its thread's reply count, activity time and hot score."""
+    from .models import Thread
+
+    with transaction.atomic():
+        Thread.objects.filter(id=thread_id).update(
+            reply_count=F('reply_count') + 1,
+            last_activity_at=replied_at or timezone.now(),
+        )
+        refresh_hot_score(thread_id)
+
+
+def refresh_rankings(batch_size=1000):
+    """Recompute every thread's reply count, last activity and hot score from the source rows.
+
+    Incremental updates keep these current as votes and replies arrive; this
+    repairs whatever they miss (deleted or bulk-loaded replies, rebuilt vote
+    counters, changed ``RANKING`` settings). Replies are aggregated in one
+    grouped query and only threads whose values changed are written.
+    Returns the number of threads updated.
+    """
+    from .models import Reply, Thread
+
+    replies = {
+        row['thread_id']: (row['count'], row['latest'])
+        for row in Reply.objects.values('thread_id')
+        .annotate(count=Count('id'), latest=Max('created_at')).order_by()
+    }
+
+    fields = ['reply_count', 'last_activity_at', 'hot_score']
+    changed = []
+    updated = 0
+    threads = Thread.objects.only('id', 'created_at', 'score', *fields).order_by('id')
+    for thread in threads.iterator(chunk_size=batch_size):
+        reply_count, latest = replies.get(thread.id, (0, None))
+        values = (
+            reply_count,
+            max(thread.created_at, latest) if latest else thread.created_at,
+            hot_score(thread.score, reply_count, thread.created_at),
+        )
+        if values != tuple(getattr(thread, field) for field in fields):
+            thread.reply_count, thread.last_activity_at, thread.hot_score = values
+            changed.append(thread)
+        if len(changed) >= batch_size:
+            Thread.objects.bulk_update(changed, fields)
+            updated += len(changed)
+            changed = []
+    Thread.objects.bulk_update(changed, fields)
+    return updated + len(changed)
+
+
+def sort_threads(queryset, sort, period='day'):
+    """Order a thread queryset for a listing sort mode.
+
+    Returns ``(queryset, sort)``; unknown modes fall back to ``'new'``.
+    Every mode walks an index on a stored column. "top" is limited to
+    threads created within ``period`` (one of ``TOP_PERIODS``).
+    """
+    if sort == 'hot':
+        return queryset.order_by('-hot_score', '-id'), sort
+    if sort == 'top':
+        since = TOP_PERIODS.get(period, TOP_PERIODS['day'])
+        if since is not None:
+            queryset = queryset.filter(created_at__gte=timezone.now() - since)
+        return queryset.order_by('-score', '-id'), sort
+    if sort == 'active':
+        return queryset.order_by('-last_activity_at', '-id'), sort
+    return queryset.order_by('-created_at', '-id'), 'new'
@@ -0,0 +1,157 @@
+import math
+import re
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+from . import metrics
+
+DEFAULT_EVENTS = {
+    'new_thread': {'user': '5/min'},
+    'new_reply': {'user': '20/min', 'connection': '10/min'},
+    'vote': {'user': '60/min', 'connection': '30/min'},
+    'chat_message': {'user': '30/min', 'connection': '10/10s'},
+}
+
+UNITS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+# The local store drops buckets that have refilled completely once it holds
+# this many.
+LOCAL_SWEEP_SIZE = 10000
+
+
+def parse_rate(rate):
+    """Turn ``'30/min'`` or ``'10/10s'`` into ``(capacity, tokens per second)``."""
+    match = re.fullmatch(r'(\d+)/(\d*)([a-z]+)', rate.strip())
+    if not match or match.group(3) not in UNITS:
+        raise ValueError(f'Invalid rate {rate!r}')
+    count = int(match.group(1))
+    period = int(match.group(2) or 1) * UNITS[match.group(3)]
+    return count, count / period
+
+
+class LocalBucketStore:
+    """Bucket state in this process's memory."""
+
+    blocking = False
+
+    def __init__(self):
+        self._buckets = {}  # key -> (tokens, stamp, expires)
+
+    def get_many(self, keys):
+        return {key: self._buckets[key][:2] for key in keys if key in self._buckets}
+
+    def set_many(self, values, now):
+        for key, (state, ttl) in values.items():
+            self._buckets[key] = (*state, now + ttl)
+        if len(self._buckets) > LOCAL_SWEEP_SIZE:
+            self._buckets = {key: value for key, value in self._buckets.items() if value[2] > now}
+
+
+class CacheBucketStore:
+    """Bucket state in a Django cache, shared by every process using it.
+
+    Reads and writes are not atomic across processes, so concurrent
+    requests from one user can occasionally both take the last token.
+    """
+
+    blocking = True
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def get_many(self, keys):
+        return self.cache.get_many(keys)
+
+    def set_many(self, values, now):
+        timeout = math.ceil(max(ttl for _state, ttl in values.values()))
+        self.cache.set_many({key: state for key, (state, _ttl) in values.items()}, timeout)
+
+
+class RateLimiter:
+    """Token buckets per event type, per user and per WebSocket connection.
+
+    ``events`` maps an event name to ``{'user': rate, 'connection': rate}``;
+    either scope may be left out. An event is allowed only when every
+    bucket that applies to it has a token, and then each of them gives one
+    up. Full buckets are not stored at all.
+    """
+
+    def __init__(self, events, store):
+        self.store = store
+        self.rules = {
+            event: {scope: parse_rate(rate) for scope, rate in scopes.items()}
+            for event, scopes in events.items()
+        }
+        self._lock = threading.Lock()
+
+    def throttle(self, event, user_id=None, connection=None):
+        """Take a token for ``event``. Returns 0, or the seconds to wait before retrying."""
+        rules = self.rules.get(event)
+        if not rules:
+            return 0
+        buckets = {}
+        if user_id is not None and 'user' in rules:
+            buckets[f'ratelimit:{event}:user:{user_id}'] = rules['user']
+        if connection is not None and 'connection' in rules:
+            buckets[f'ratelimit:{event}:conn:{connection}'] = rules['connection']
+        if not buckets:
+            return 0
+
+        now = time.time()
+        with self._lock:
+            states = self.store.get_many(list(buckets))
+            wait, updated = 0, {}
+            for key, (capacity, per_second) in buckets.items():
+                tokens, stamp = states.get(key, (capacity, now))
+                tokens = min(capacity, tokens + (now - stamp) * per_second)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / per_second)
+                # Time until the bucket is full again, after which it can be forgotten.
+                updated[key] = ((tokens - 1, now), (capacity - tokens + 1) / per_second)
+            if not wait:
+                self.store.set_many(updated, now)
+
+        if wait:
+            metrics.increment('ratelimit_throttled')
+            metrics.increment(f'ratelimit_throttled_{event}')
+        return wait
+
+    async def athrottle(self, event, user_id=None, connection=None):
+        if self.store.blocking:
+            return await sync_to_async(self.throttle, thread_sensitive=False)(event, user_id, connection)
+        return self.throttle(event, user_id, connection)
+
+
+def rate_limit(event):
+    """Answer POSTs to the decorated view with 429 once the user's ``event`` bucket is empty."""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method == 'POST' and request.user.is_authenticated:
+                wait = rate_limiter.throttle(event, user_id=request.user.pk)
+                if wait:
+                    retry_after = math.ceil(wait)
+                    response = JsonResponse({'error': 'Rate limit exceeded', 'retry_after': retry_after}, status=429)
+                    response['Retry-After'] = str(retry_after)
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def _build_rate_limiter():
+    config = getattr(settings, 'RATE_LIMITS', {})
+    if config.get('BACKEND', 'local') == 'cache':
+        store = CacheBucketStore(config.get('CACHE', 'default'))
+    else:
+        store = LocalBucketStore()
+    return RateLimiter(config.get('EVENTS', DEFAULT_EVENTS), store)
+
+
+rate_limiter = _build_rate_limiter()
@@ -0,0 +1,106 @@
+import json
+import uuid
+from collections import deque
+
+from django.conf import settings
+
+
+class LocalEventLog:
+    """Sequence numbers and a short replay window for broadcast frames, in process memory.
+
+    ``epoch`` changes on every restart, so a client resuming against a new
+    process is told to resync instead of being matched against unrelated
+    sequence numbers.
+    """
+
+    def __init__(self, window=1000):
+        self.epoch = uuid.uuid4().hex
+        self.seq = 0
+        self._events = deque(maxlen=window)
+
+    async def current(self):
+        return self.epoch, self.seq
+
+    async def record(self, groups, build_frame):
+        """Assign the next sequence number, build the frame with it and keep it for replay.
+
+        Returns ``(epoch, frame)``.
+        """
+        self.seq += 1
+        frame = build_frame(self.seq)
+        self._events.append((self.seq, frozenset(groups), frame))
+        return self.epoch, frame
+
+    async def since(self, epoch, last_seq, groups):
+        """Frames after ``last_seq`` for any of ``groups``, or None if they are no longer all held."""
+        if epoch != self.epoch or last_seq > self.seq:
+            return None
+        oldest = self._events[0][0] if self._events else self.seq + 1
+        if last_seq < oldest - 1:
+            return None
+        missed = []
+        for seq, event_groups, frame in reversed(self._events):
+            if seq <= last_seq:
+                break
+            if event_groups & groups:
+                missed.append(frame)
+        missed.reverse()
+        return missed
+
+
+class RedisEventLog:
+    """The same log kept in Redis, so sequence numbers survive restarts and are shared by workers."""
+
+    def __init__(self, url, window=1000, prefix='chat:events'):
+        import redis.asyncio as redis
+
+        self.window = window
+        self.prefix = prefix
+        self._redis = redis.from_url(url)
+
+    async def _epoch(self):
+        await self._redis.set(f'{self.prefix}:epoch', uuid.uuid4().hex, nx=True)
+        return (await self._redis.get(f'{self.prefix}:epoch')).decode()
+
+    async def current(self):
+        seq = await self._redis.get(f'{self.prefix}:seq')
+        return await self._epoch(), int(seq or 0)
+
+    async def record(self, groups, build_frame):
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.set(f'{self.prefix}:epoch', uuid.uuid4().hex, nx=True)
+            pipe.get(f'{self.prefix}:epoch')
+            pipe.incr(f'{self.prefix}:seq')
+            _created, epoch, seq = await pipe.execute()
+        frame = build_frame(seq)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.zadd(f'{self.prefix}:log', {json.dumps([sorted(groups), frame]): seq})
+            pipe.zremrangebyrank(f'{self.prefix}:log', 0, -self.window - 1)
+            await pipe.execute()
+        return epoch.decode(), frame
+
+    async def since(self, epoch, last_seq, groups):
+        current_epoch, seq = await self.current()
+        if epoch != current_epoch or last_seq > seq:
+            return None
+        oldest = await self._redis.zrange(f'{self.prefix}:log', 0, 0, withscores=True)
+        oldest_seq = int(oldest[0][1]) if oldest else seq + 1
+        if last_seq < oldest_seq - 1:
+            return None
+        missed = []
+        for raw in await self._redis.zrangebyscore(f'{self.prefix}:log', last_seq + 1, '+inf'):
+            event_groups, frame = json.loads(raw)
+            if groups.intersection(event_groups):
+                missed.append(frame)
+        return missed
+
+
+def _build_event_log():
+    config = getattr(settings, 'EVENT_REPLAY', {})
+    window = config.get('WINDOW', 1000)
+    if config.get('BACKEND', 'local') == 'redis':
+        return RedisEventLog(config['REDIS_URL'], window=window)
+    return LocalEventLog(window=window)
+
+
+event_log = _build_event_log()
@@ -0,0 +1,233 @@
+import re
+
+from django.db import connections, router, DEFAULT_DB_ALIAS, OperationalError
+from django.db.models import Case, When, Q
+from django.utils.html import escape
+
+# Results are ranked in SQLite and then loaded through the ORM, so a broad
+# query never materializes more than this many thread ids.
+MAX_RESULTS = 500
+
+# Reply matches count for less than a match in the thread itself.
+REPLY_RANK_WEIGHT = 0.5
+
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+
+_available = {}
+
+SEARCH_TABLES = ('chat_thread_fts', 'chat_reply_fts')
+SEARCH_TRIGGERS = (
+    'chat_thread_fts_ai', 'chat_thread_fts_ad', 'chat_thread_fts_au',
+    'chat_reply_fts_ai', 'chat_reply_fts_ad', 'chat_reply_fts_au',
+)
+
+CREATE_STATEMENTS = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS chat_thread_fts USING fts5(
+        title, content, content='chat_thread', content_rowid='id', tokenize='unicode61'
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS chat_reply_fts USING fts5(
+        content, content='chat_reply', content_rowid='id', tokenize='unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_thread_fts_ai AFTER INSERT ON chat_thread BEGIN
+        INSERT INTO chat_thread_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_thread_fts_ad AFTER DELETE ON chat_thread BEGIN
+        INSERT INTO chat_thread_fts(chat_thread_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_thread_fts_au AFTER UPDATE OF title, content ON chat_thread BEGIN
+        INSERT INTO chat_thread_fts(chat_thread_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO chat_thread_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_reply_fts_ai AFTER INSERT ON chat_reply BEGIN
+        INSERT INTO chat_reply_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_reply_fts_ad AFTER DELETE ON chat_reply BEGIN
+        INSERT INTO chat_reply_fts(chat_reply_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_reply_fts_au AFTER UPDATE OF content ON chat_reply BEGIN
+        INSERT INTO chat_reply_fts(chat_reply_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO chat_reply_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+]
+
+DROP_STATEMENTS = [
+    "DROP TRIGGER IF EXISTS chat_thread_fts_ai",
+    "DROP TRIGGER IF EXISTS chat_thread_fts_ad",
+    "DROP TRIGGER IF EXISTS chat_thread_fts_au",
+    "DROP TRIGGER IF EXISTS chat_reply_fts_ai",
+    "DROP TRIGGER IF EXISTS chat_reply_fts_ad",
+    "DROP TRIGGER IF EXISTS chat_reply_fts_au",
+    "DROP TABLE IF EXISTS chat_thread_fts",
+    "DROP TABLE IF EXISTS chat_reply_fts",
+]
+
+SEARCH_SQL = """
+    SELECT thread_id, MIN(rank) AS rank, snippet FROM (
+        SELECT rowid AS thread_id,
+               bm25(chat_thread_fts, 10.0, 1.0) AS rank,
+               snippet(chat_thread_fts, -1, %s, %s, '…', 16) AS snippet
+        FROM chat_thread_fts WHERE chat_thread_fts MATCH %s
+        UNION ALL
+        SELECT chat_reply.thread_id,
+               bm25(chat_reply_fts) * %s AS rank,
+               snippet(chat_reply_fts, 0, %s, %s, '…', 16) AS snippet
+        FROM chat_reply_fts JOIN chat_reply ON chat_reply.id = chat_reply_fts.rowid
+        WHERE chat_reply_fts MATCH %s
+    )
+    GROUP BY thread_id
+    ORDER BY rank
+    LIMIT %s
+"""
+
+
+def create_search_index(connection):
+    """Create the FTS5 tables and sync triggers. Returns False if FTS5 is unavailable."""
+    if connection.vendor != 'sqlite':
+        return False
+    try:
+        with connection.cursor() as cursor:
+            for statement in CREATE_STATEMENTS:
+                cursor.execute(statement)
+    except OperationalError:
+        return False
+    _available.pop(connection.alias, None)
+    return True
+
+
+def drop_search_index(connection):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for statement in DROP_STATEMENTS:
+            cursor.execute(statement)
+    _available.pop(connection.alias, None)
+
+
+def rebuild_search_index(using=DEFAULT_DB_ALIAS):
+    """(Re)create the index and repopulate it from chat_thread and chat_reply."""
+    connection = connections[using]
+    if not create_search_index(connection):
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("INSERT INTO chat_thread_fts(chat_thread_fts) VALUES ('rebuild')")
+        cursor.execute("INSERT INTO chat_reply_fts(chat_reply_fts) VALUES ('rebuild')")
+    return True
+
+
+def _existing_search_objects(connection, names):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT COUNT(*) FROM sqlite_master WHERE name IN ({', '.join(['%s'] * len(names))})", names
+        )
+        return cursor.fetchone()[0]
+
+
+def search_available(using=DEFAULT_DB_ALIAS):
+    """Whether the FTS tables exist along with every trigger that keeps them in sync."""
+    if using not in _available:
+        connection = connections[using]
+        if connection.vendor != 'sqlite':
+            _available[using] = False
+        else:
+            names = SEARCH_TABLES + SEARCH_TRIGGERS
+            _available[using] = _existing_search_objects(connection, names) == len(names)
+    return _available[using]
+
+
+def restore_search_triggers(using=DEFAULT_DB_ALIAS, **kwargs):
+    """``post_migrate`` handler: put back sync triggers a migration dropped.
+
+    SQLite adds or removes a column by rebuilding the table, which drops the
+    triggers on it, and rows written meanwhile never reach the index. If the
+    FTS tables exist but a trigger is missing, the triggers are recreated and
+    the index rebuilt. An index that was never created (or was migrated
+    away) is left alone.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or not router.allow_migrate(using, 'chat'):
+        return
+    if _existing_search_objects(connection, SEARCH_TABLES) != len(SEARCH_TABLES):
+        return
+    if _existing_search_objects(connection, SEARCH_TRIGGERS) != len(SEARCH_TRIGGERS):
+        rebuild_search_index(using=using)
+
+
+def build_match_query(query):
+    """Turn free text into a safe FTS5 expression: every word must match, the last as a prefix."""
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return ''
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def highlight(snippet):
+    return escape(snippet).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def ranked_thread_matches(query, limit=MAX_RESULTS, using=DEFAULT_DB_ALIAS):
+    """Return ``[(thread_id, snippet_html), ...]`` best match first, or None to fall back.
+
+    None means the FTS index cannot answer (missing table, FTS5 not compiled
+    in, non-SQLite backend) and the caller should use its LIKE query instead.
+    """
+    if not search_available(using):
+        return None
+    match = build_match_query(query)
+    if not match:
+        return []
+    try:
+        with connections[using].cursor() as cursor:
+            cursor.execute(SEARCH_SQL, [
+                _MARK_START, _MARK_END, match,
+                REPLY_RANK_WEIGHT, _MARK_START, _MARK_END, match,
+                limit,
+            ])
+            rows = cursor.fetchall()
+    except OperationalError:
+        return None
+    return [(thread_id, highlight(snippet)) for thread_id, _rank, snippet in rows]
+
+
+def search_threads(queryset, query, limit=MAX_RESULTS):
+    """Filter ``queryset`` down to threads matching ``query``, ranked by bm25.
+
+    Returns ``(queryset, snippets)`` where ``snippets`` maps thread id to the
+    hit highlighted in ``<mark>``. Falls back to ``icontains`` (and no
+    snippets) when the FTS index is unavailable.
+    """
+    matches = ranked_thread_matches(query, limit=limit, using=queryset.db)
+    if matches is None:
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(content__icontains=query) |
+            Q(author__username__icontains=query)
+        ), {}
+
+    if not matches:
+        return queryset.none(), {}
+    ids = [thread_id for thread_id, _snippet in matches]
+    ranked = queryset.filter(id__in=ids).order_by(
+        Case(*[When(id=thread_id, then=position) for position, thread_id in enumerate(ids)])
+    )
+    return ranked, dict(matches)
@@ -0,0 +1,112 @@
+import asyncio
+import weakref
+from collections import deque
+
+from . import metrics
+
+DROP_OLDEST = 'drop_oldest'
+COLLAPSE = 'collapse'
+DISCONNECT = 'disconnect'
+POLICIES = (DROP_OLDEST, COLLAPSE, DISCONNECT)
+
+_live_queues = weakref.WeakSet()
+
+
+class SendQueue:
+    """Bounded outgoing frame queue for one WebSocket connection.
+
+    When ``maxsize`` frames are already waiting, ``policy`` decides what
+    happens to the next one:
+
+    * ``drop_oldest``: discard the oldest waiting frame.
+    * ``collapse``: a frame whose ``key`` is already queued replaces the
+      queued one in place (e.g. newer vote counts for the same object); if
+      nothing matches, the oldest frame is dropped.
+    * ``disconnect``: refuse the frame; ``put`` returns False and the caller
+      should close the socket and tell the client to resync.
+
+    Every outgoing frame goes through the queue, so the bound covers
+    replies to the client's own requests as well as broadcasts.
+    ``batchable`` frames (broadcasts) may be sent together in one array
+    when the socket has batching enabled.
+
+    The queue only fills if the writer's ``send`` waits for the socket:
+    under uvicorn's ``websockets``/``websockets-sansio`` protocols it does,
+    while daphne buffers everything in the transport and returns at once.
+    """
+
+    def __init__(self, maxsize=200, policy=COLLAPSE):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown send queue policy: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self.collapsed = 0
+        self._entries = deque()
+        self._by_key = {}
+        self._ready = asyncio.Event()
+        _live_queues.add(self)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, frame, key=None, batchable=False):
+        if self.policy == COLLAPSE and key is not None and key in self._by_key:
+            self._by_key[key][1] = frame
+            self.collapsed += 1
+            metrics.increment('ws_frames_collapsed')
+            return True
+
+        if len(self._entries) >= self.maxsize:
+            if self.policy == DISCONNECT:
+                metrics.increment('ws_slow_consumer_disconnects')
+                return False
+            self._drop_oldest()
+
+        entry = [key, frame, batchable]
+        self._entries.append(entry)
+        if key is not None and self.policy == COLLAPSE:
+            self._by_key[key] = entry
+        self._ready.set()
+        return True
+
+    async def get(self):
+        """Wait for the next frame; returns ``(frame, batchable)``."""
+        while not self._entries:
+            self._ready.clear()
+            await self._ready.wait()
+        entry = self._entries.popleft()
+        self._forget(entry)
+        return entry[1], entry[2]
+
+    def get_all(self):
+        """Take every waiting frame without blocking, as ``[(frame, batchable), ...]``."""
+        entries, self._entries = self._entries, deque()
+        self._by_key.clear()
+        return [(frame, batchable) for _key, frame, batchable in entries]
+
+    def clear(self):
+        self._entries.clear()
+        self._by_key.clear()
+
+    def _drop_oldest(self):
+        self._forget(self._entries.popleft())
+        self.dropped += 1
+        metrics.increment('ws_frames_dropped')
+
+    def _forget(self, entry):
+        key = entry[0]
+        if key is not None and self._by_key.get(key) is entry:
+            del self._by_key[key]
+
+
+def _total_depth():
+    return sum(len(queue) for queue in list(_live_queues))
+
+
+def _max_depth():
+    return max((len(queue) for queue in list(_live_queues)), default=0)
+
+
+metrics.register_gauge('ws_send_queue_depth_total', _total_depth)
+metrics.register_gauge('ws_send_queue_depth_max', _max_depth)
@@ -0,0 +1,54 @@
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Reply
+from .votes import vote_states_for_page
+
+
+def with_summary_fields(queryset):
+    """Join author/category and annotate ``replies_count`` onto a thread queryset.
+
+    The reply count is a correlated subquery rather than a GROUP BY join, so
+    SQLite only evaluates it for the rows that survive ordering and slicing.
+    """
+    replies_count = (
+        Reply.objects.filter(thread=OuterRef('pk'))
+        .order_by()
+        .values('thread')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    return queryset.select_related('author', 'category').annotate(
+        replies_count=Coalesce(Subquery(replies_count, output_field=IntegerField()), 0)
+    )
+
+
+def serialize_thread_summaries(threads, user, snippets=None, content_length=100):
+    """Serialize threads loaded through ``with_summary_fields``.
+
+    Issues a single extra query (the viewer's votes) for the whole batch.
+    ``content_length=None`` keeps the full body.
+    """
+    threads = list(threads)
+    snippets = snippets or {}
+    vote_states = vote_states_for_page(user, threads=threads)
+
+    summaries = []
+    for thread in threads:
+        content = thread.content
+        if content_length is not None and len(content) > content_length:
+            content = content[:content_length] + '...'
+        vote_state = vote_states[('thread', thread.id)]
+        summaries.append({
+            'id': thread.id,
+            'title': thread.title,
+            'content': content,
+            'author': thread.author.username,
+            'category': thread.category.name if thread.category else 'General',
+            'created_at': thread.created_at.strftime('%Y-%m-%d %H:%M'),
+            'replies_count': thread.replies_count,
+            'vote_count': vote_state['vote_count'],
+            'user_vote': vote_state['user_vote'],
+            'snippet': snippets.get(thread.id, ''),
+        })
+    return summaries
@@ -0,0 +1,451 @@
+import asyncio
+import json
+import re
+import time
+from unittest import mock
+
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from chat.broadcast import broadcast
+from chat.chatbuffer import ChatWriteBuffer
+from chat.consumers import ChatConsumer
+from chat.groups import THREADS_GROUP, category_group
+from chat.history import LocalChatHistory
+from chat.models import Category, ChatMessage, Notification, Reply, Thread, UserProfile
+from chat.presence import PresenceTracker
+from chat.pagination import encode_cursor
+from chat import search
+from chat.search import ranked_thread_matches, search_available
+from chat.votes import cast_vote, vote_states_for_page
+
+
+class SearchQueryCountTests(TestCase):
+    """/chat/search/ costs the same number of queries for 1 result as for 20."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader', password='x')
+        author = User.objects.create_user('author', password='x')
+        category = Category.objects.create(name='Gardening')
+        threads = [
+            Thread.objects.create(
+                title=f'Tomato question {i}', content='How often should tomatoes be watered?',
+                author=author, category=category if i % 2 else None,
+            )
+            for i in range(25)
+        ]
+        Thread.objects.create(title='Lonely orchid', content='Repotting', author=author, category=category)
+        cast_vote('thread', threads[0].id, 1, cls.reader)
+
+    def setUp(self):
+        # The FTS availability probe runs once per process; keep it out of the counts.
+        search_available()
+
+    def search(self, query):
+        response = self.client.get('/chat/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['threads']
+
+    def test_anonymous_query_count_is_constant(self):
+        # FTS match, then the threads with author, category and reply count.
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.search('orchid')), 1)
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.search('tomato')), 20)
+
+    def test_authenticated_query_count_is_constant(self):
+        self.client.force_login(self.reader)
+        # Session and user, FTS match, threads, and one query for the reader's votes.
+        with self.assertNumQueries(5):
+            self.assertEqual(len(self.search('orchid')), 1)
+        with self.assertNumQueries(5):
+            results = self.search('tomato')
+        self.assertEqual(len(results), 20)
+        self.assertIn(1, [thread['user_vote'] for thread in results])
+
+    def test_query_count_does_not_depend_on_replies(self):
+        thread = Thread.objects.get(title='Lonely orchid')
+        for i in range(5):
+            thread.replies.create(content=f'reply {i}', author=self.reader)
+        with CaptureQueriesContext(connection) as captured:
+            results = self.search('orchid')
+        self.assertEqual(results[0]['replies_count'], 5)
+        self.assertEqual(len(captured), 2)
+
+
+class SearchTriggerTests(TestCase):
+    def setUp(self):
+        self.addCleanup(search._available.clear)
+
+    def test_dropped_trigger_is_restored_after_migrate(self):
+        author = User.objects.create_user('author', password='x')
+        thread = Thread.objects.create(title='Orchids', content='Repotting', author=author)
+        # What a migration that rebuilds chat_reply leaves behind.
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER chat_reply_fts_ai")
+        search._available.clear()
+        self.assertFalse(search_available())
+
+        thread.replies.create(content='Use bark, not soil', author=author)
+        emit_post_migrate_signal(verbosity=0, interactive=False, db=connection.alias)
+        self.assertTrue(search_available())
+        self.assertEqual([thread_id for thread_id, _snippet in ranked_thread_matches('bark')], [thread.id])
+
+
+class OnlineUsersTests(TestCase):
+    def test_requires_login(self):
+        response = self.client.get('/chat/online/')
+        self.assertEqual(response.status_code, 302)
+        self.client.force_login(User.objects.create_user('reader', password='x'))
+        self.assertEqual(self.client.get('/chat/online/').status_code, 200)
+
+
+class BroadcastDeliveryTests(TransactionTestCase):
+    async def connect(self):
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/')
+        communicator.scope['session'] = SessionStore()
+        connected, _subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.receive_json_from()  # hello
+        await communicator.receive_json_from()  # chat_history
+        return communicator
+
+    async def test_event_sent_to_two_subscribed_groups_arrives_once(self):
+        communicator = await self.connect()
+        for subscription in ({'topic': 'threads'}, {'topic': 'category', 'id': 7}):
+            await communicator.send_json_to({'type': 'subscribe', **subscription})
+            await communicator.receive_json_from()
+
+        await broadcast(get_channel_layer(), [THREADS_GROUP, category_group(7)], 'new_thread', 'thread', {'id': 1})
+        frame = await communicator.receive_json_from()
+        self.assertEqual(frame['thread'], {'id': 1})
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_same_seq_from_two_workers_arrives_twice(self):
+        communicator = await self.connect()
+        await communicator.send_json_to({'type': 'subscribe', 'topic': 'threads'})
+        await communicator.receive_json_from()
+
+        # Two workers with local event logs both number their first broadcast 1.
+        for epoch, thread_id in (('worker-a', 1), ('worker-b', 2)):
+            frame = json.dumps({'type': 'new_thread', 'thread': {'id': thread_id}, 'seq': 1})
+            await get_channel_layer().group_send(THREADS_GROUP, {
+                'type': 'forward_frame', 'frame': frame, 'epoch': epoch, 'seq': 1,
+            })
+        self.assertEqual((await communicator.receive_json_from())['thread'], {'id': 1})
+        self.assertEqual((await communicator.receive_json_from())['thread'], {'id': 2})
+        await communicator.disconnect()
+
+
+class MalformedFrameTests(TransactionTestCase):
+    connect = BroadcastDeliveryTests.connect
+
+    async def test_unhashable_type_is_rejected(self):
+        communicator = await self.connect()
+        await communicator.send_json_to({'type': []})
+        self.assertEqual(await communicator.receive_json_from(), {'error': 'Invalid message type'})
+        await communicator.send_json_to({'type': 'heartbeat'})
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_text_frame_that_is_not_a_json_object_is_rejected(self):
+        communicator = await self.connect()
+        for text in ('not json', '[1, 2]'):
+            await communicator.send_to(text_data=text)
+            self.assertEqual(await communicator.receive_json_from(), {'error': 'Invalid JSON frame'})
+        await communicator.send_json_to({'type': 'heartbeat'})
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+
+# SQLite checks foreign keys at commit, so these need real transactions.
+class ChatWriteBufferTests(TransactionTestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        # Long enough that the background thread never flushes mid-test.
+        self.buffer = ChatWriteBuffer(batch_size=1000, flush_interval=3600, max_retries=2, max_pending=3)
+
+    def test_bad_row_is_dropped_and_the_rest_written(self):
+        first = self.buffer.add('one', self.alice)
+        self.buffer.add('orphan', self.bob)
+        last = self.buffer.add('two', self.alice)
+        User.objects.filter(pk=self.bob.pk).delete()
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(list(ChatMessage.objects.values_list('id', flat=True).order_by('id')), [first.id, last.id])
+        self.assertEqual(self.buffer._pending, [])
+
+    def test_failing_batch_is_dropped_after_max_retries(self):
+        self.buffer.add('one', self.alice)
+        with mock.patch.object(ChatMessage.objects, 'bulk_create', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                self.buffer.flush()
+            self.assertEqual(len(self.buffer._pending), 1)
+            with self.assertRaises(OperationalError):
+                self.buffer.flush()
+        self.assertEqual(self.buffer._pending, [])
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_pending_is_capped(self):
+        messages = [self.buffer.add(str(n), self.alice) for n in range(5)]
+        self.assertEqual(self.buffer._pending, messages[2:])
+
+
+class LocalChatHistoryTests(SimpleTestCase):
+    async def history(self, *ids):
+        history = LocalChatHistory(size=3)
+        history._warm = True
+        for message_id in ids:
+            await history.append({'id': message_id})
+        return [message['id'] for message in await history.recent()]
+
+    async def test_lower_id_from_another_worker_is_inserted_in_order(self):
+        self.assertEqual(await self.history(500, 502, 501), [500, 501, 502])
+
+    async def test_held_id_is_not_added_twice(self):
+        self.assertEqual(await self.history(500, 501, 500), [500, 501])
+
+    async def test_full_buffer_keeps_the_newest_ids(self):
+        self.assertEqual(await self.history(500, 502, 503, 501), [501, 502, 503])
+        self.assertEqual(await self.history(500, 502, 503, 499), [500, 502, 503])
+
+
+class PresenceFlushTests(TransactionTestCase):
+    def test_pending_timestamps_are_flushed_without_further_touches(self):
+        profile = UserProfile.objects.create(user=User.objects.create_user('alice', password='pw'))
+        tracker = PresenceTracker(flush_interval=0.05)
+        tracker.touch(profile.user_id, force=True)
+        seen = tracker.last_seen(profile.user_id)
+        deadline = time.monotonic() + 5
+        while profile.last_seen != seen and time.monotonic() < deadline:
+            time.sleep(0.01)
+            profile.refresh_from_db()
+        self.assertEqual(profile.last_seen, seen)
+
+
+class StalledConsumer(ChatConsumer):
+    """A socket whose client stopped reading: ``send`` waits until ``unblock`` is set."""
+
+    instances = []
+
+    # Whether the close frame is stuck behind the unread data as well.
+    stall_close = False
+
+    async def connect(self):
+        self.unblock = asyncio.Event()
+        # Before connect() finishes: accept() returns control to the test early.
+        StalledConsumer.instances.append(self)
+        await super().connect()
+
+    async def send(self, *args, **kwargs):
+        await self.unblock.wait()
+        await super().send(*args, **kwargs)
+
+    async def close(self, code=None, reason=None):
+        if self.stall_close:
+            await self.unblock.wait()
+        await super().close(code, reason)
+
+
+class SendQueueTests(TransactionTestCase):
+    async def connect_stalled(self):
+        StalledConsumer.instances.clear()
+        communicator = WebsocketCommunicator(StalledConsumer.as_asgi(), '/ws/chat/')
+        communicator.scope['session'] = SessionStore()
+        connected, _subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator, StalledConsumer.instances[0]
+
+    async def forward(self, consumer, count):
+        layer = get_channel_layer()
+        for seq in range(1, count + 1):
+            frame = json.dumps({'type': 'new_thread', 'thread': {'id': seq}, 'seq': seq})
+            await layer.send(consumer.channel_name, {'type': 'forward_frame', 'frame': frame, 'seq': seq})
+
+    @override_settings(WEBSOCKET_SEND_QUEUE={'maxsize': 10, 'policy': 'drop_oldest'})
+    async def test_stalled_socket_is_bounded_by_the_queue(self):
+        communicator, consumer = await self.connect_stalled()
+        await self.forward(consumer, 50)
+        self.assertTrue(await communicator.receive_nothing())
+        self.assertEqual(len(consumer.send_queue), 10)
+        self.assertGreater(consumer.send_queue.dropped, 0)
+
+        consumer.unblock.set()
+        frames = [await communicator.receive_json_from() for _ in range(11)]
+        self.assertEqual(frames[0]['type'], 'hello')
+        self.assertEqual([frame['thread']['id'] for frame in frames[1:]], list(range(41, 51)))
+        await communicator.disconnect()
+
+    @override_settings(WEBSOCKET_SEND_QUEUE={'maxsize': 10, 'policy': 'disconnect', 'close_timeout': 0.1})
+    async def test_stalled_socket_is_closed_without_reading(self):
+        communicator, consumer = await self.connect_stalled()
+        await self.forward(consumer, 20)
+        # The hint can't get past the unread data; the close still goes out.
+        self.assertEqual(await communicator.receive_output(), {'type': 'websocket.close', 'code': 4008})
+        self.assertTrue(consumer.writer_task is None)
+
+    @override_settings(WEBSOCKET_SEND_QUEUE={'maxsize': 10, 'policy': 'disconnect', 'close_timeout': 0.1})
+    async def test_stalled_socket_is_dropped_when_even_the_close_is_stuck(self):
+        StalledConsumer.stall_close = True
+        self.addCleanup(setattr, StalledConsumer, 'stall_close', False)
+        communicator, consumer = await self.connect_stalled()
+        await self.forward(consumer, 20)
+        await communicator.wait(timeout=1)
+        self.assertFalse(consumer.subscriptions)
+
+    @override_settings(WEBSOCKET_SEND_QUEUE={'maxsize': 10, 'policy': 'disconnect'})
+    async def test_socket_that_reads_again_gets_the_resync_hint(self):
+        communicator, consumer = await self.connect_stalled()
+        await self.forward(consumer, 20)
+        # The queue overflows while the client isn't reading; it reads again
+        # within close_timeout.
+        self.assertTrue(await communicator.receive_nothing())
+        consumer.unblock.set()
+        frames = []
+        while (output := await communicator.receive_output())['type'] == 'websocket.send':
+            frames.append(json.loads(output['text']))
+        self.assertEqual(frames[-1], {'type': 'resync_required', 'reason': 'slow_consumer'})
+        self.assertEqual(output, {'type': 'websocket.close', 'code': 4008})
+
+    async def test_batched_broadcasts_go_out_as_one_array(self):
+        communicator, consumer = await self.connect_stalled()
+        consumer.unblock.set()
+        await communicator.receive_json_from()  # hello
+        await communicator.receive_json_from()  # chat_history
+        await communicator.send_json_to({'type': 'set_batching', 'window_ms': 100})
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'batching', 'window_ms': 100})
+
+        await self.forward(consumer, 3)
+        batch = await communicator.receive_json_from()
+        self.assertEqual([frame['thread']['id'] for frame in batch], [1, 2, 3])
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+
+# Tables a plan may read in full, and why.
+ALLOWED_FULL_SCANS = {
+    'chat_category': 'the filter bar lists every category',
+}
+
+# Scenarios whose ORDER BY may be sorted in a temporary B-tree rather than
+# read in index order, and why.
+ALLOWED_SORTS = {
+    'index, top of the week': 'the created_at range is indexed; the week is then sorted by score',
+    'category_detail, hot': 'one category is sorted by hot_score after the category lookup',
+    'notifications page': "lists all of one user's notifications, read and unread",
+}
+
+# Indexes a scenario's plans must use; losing one is a regression even if
+# another index keeps the plan free of full scans.
+EXPECTED_INDEXES = {
+    'index': 'chat_thread_recent_idx',
+    'index, category filter': 'chat_thread_cat_recent_idx',
+    'index, hot': 'chat_thread_hot_idx',
+    'index, active': 'chat_thread_active_idx',
+    'category_detail': 'chat_thread_cat_recent_idx',
+    'category_detail, cursor page': 'chat_thread_cat_recent_idx',
+    'notifications, unread (XHR)': 'chat_notif_unread_recent_idx',
+    'thread delete (vote cascade)': 'chat_vote_target_idx',
+}
+
+_SCAN = re.compile(r'^SCAN (\w+)')
+_INDEX = re.compile(r'USING (?:COVERING )?INDEX (\w+)')
+
+
+# Replicas would take the GET scenarios' reads away from the captured connection.
+@override_settings(DATABASE_REPLICAS=[])
+class QueryPlanTests(TestCase):
+    """EXPLAIN QUERY PLAN every query the listings, notifications and vote paths issue.
+
+    Fails on full-table scans, unindexed sorts and lost indexes.
+    ``manage.py check_query_plans --show-plans`` runs it printing every plan.
+    """
+
+    show_plans = False
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('plans', password='x')
+        other = User.objects.create_user('plans2', password='x')
+        cls.category = Category.objects.create(name='Plans')
+        cls.threads = [
+            Thread.objects.create(title=f'Thread {i}', content='body', author=other, category=cls.category)
+            for i in range(3)
+        ]
+        cls.reply = Reply.objects.create(thread=cls.threads[0], content='a reply', author=cls.user)
+        Notification.objects.create(user=cls.user, message='replied', thread=cls.threads[0], reply=cls.reply)
+        cast_vote('thread', cls.threads[1].id, 1, other)
+
+    def scenarios(self):
+        client, user, category, threads, reply = self.client, self.user, self.category, self.threads, self.reply
+        client.force_login(user)
+        xhr = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        cursor = encode_cursor(threads[1], 'next')
+        return [
+            ('index', lambda: client.get('/chat/')),
+            ('index, category filter', lambda: client.get('/chat/', {'category': category.id})),
+            ('index, hot', lambda: client.get('/chat/', {'sort': 'hot'})),
+            ('index, top of the week', lambda: client.get('/chat/', {'sort': 'top', 't': 'week'})),
+            ('index, active', lambda: client.get('/chat/', {'sort': 'active'})),
+            ('index, cursor page', lambda: client.get('/chat/', {'cursor': cursor})),
+            ('category_detail', lambda: client.get(f'/chat/category/{category.id}/')),
+            ('category_detail, cursor page', lambda: client.get(f'/chat/category/{category.id}/', {'cursor': cursor})),
+            ('category_detail, hot', lambda: client.get(f'/chat/category/{category.id}/', {'sort': 'hot'})),
+            ('thread_feed', lambda: client.get('/chat/threads/', {'cursor': cursor})),
+            ('notifications page', lambda: client.get('/chat/notifications/')),
+            ('notifications, unread (XHR)', lambda: client.get('/chat/notifications/', **xhr)),
+            ('notifications, mark all read', lambda: client.post('/chat/notifications/')),
+            ('vote view', lambda: client.post(f'/chat/vote/thread/{threads[0].id}/', {'vote_type': '1'})),
+            ('cast_vote on a reply', lambda: cast_vote('reply', reply.id, -1, user)),
+            ('vote states for a page', lambda: vote_states_for_page(user, threads=threads, replies=[reply])),
+            ('thread delete (vote cascade)', lambda: threads[2].delete()),
+        ]
+
+    def plan_problems(self, name, queries):
+        tables = set(connection.introspection.table_names())
+        problems = []
+        used = set()
+        for query in queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = [row[-1] for row in cursor.fetchall()]
+            bad = [
+                step for step in plan
+                if (match := _SCAN.match(step)) and match.group(1) in tables
+                and 'USING' not in step and match.group(1) not in ALLOWED_FULL_SCANS
+            ]
+            if name not in ALLOWED_SORTS:
+                bad += [step for step in plan if step.startswith('USE TEMP B-TREE FOR ORDER BY')]
+            used.update(_INDEX.findall(' '.join(plan)))
+            if bad:
+                problems += [sql] + [f'  !! {step}' for step in bad]
+            if self.show_plans:
+                print(f"  {sql}")
+                for step in plan:
+                    print(f"    {'!! ' if step in bad else ''}{step}")
+        expected = EXPECTED_INDEXES.get(name)
+        if expected and expected not in used:
+            problems.append(f'{expected} not used')
+        return problems
+
+    def test_query_plans_use_indexes(self):
+        for name, action in self.scenarios():
+            with self.subTest(scenario=name):
+                with CaptureQueriesContext(connection) as captured:
+                    action()
+                problems = self.plan_problems(name, captured.captured_queries)
+                if self.show_plans:
+                    print(f"{name}: {len(captured.captured_queries)} queries")
+                if problems:
+                    self.fail('\n'.join(problems))
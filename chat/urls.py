@@ -11,6 +11,9 @@ urlpatterns = [
     path('profile/', views.profile, name='profile'),
     path('notifications/', views.notifications, name='notifications'),
     path('search/', views.search, name='search'),
+    path('threads/', views.thread_feed, name='thread_feed'),
+    path('online/', views.online_users, name='online_users'),
+    path('metrics/', views.realtime_metrics, name='realtime_metrics'),
     path('about/', views.about, name='about'),
     path('contact/', views.contact, name='contact'),
     path('category/<int:pk>/', views.category_detail, name='category_detail'),
@@ -1,46 +1,66 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.http import JsonResponse, HttpResponseBadRequest
 from django.views.decorators.csrf import csrf_exempt
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
 from django.contrib.auth import login
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_GET, require_http_methods
 from django.contrib import messages
-from django.core.paginator import Paginator
-from django.db.models import Q
 from django.core.mail import send_mail
-from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth.models import User
+from asgiref.sync import async_to_sync
 
 import json
 
 from .models import (
-    Category, Thread, Reply, Vote, ChatMessage,
+    Category, Thread, ChatMessage,
     UserProfile, Notification
 )
 from .forms import ThreadForm, ReplyForm, UserProfileForm
+from .votes import VOTABLE_MODELS, cast_vote, vote_states_for_page
+from .search import search_threads
+from .pagination import paginate_by_cursor, paginate_threads
+from .ranking import record_reply, sort_threads
+from .serializers import serialize_thread_summaries, with_summary_fields
+from .notifications import notify, reset_unread
+from .online import online_registry
+from . import metrics
+from .history import chat_history, serialize_message
+from .chatbuffer import chat_write_buffer
+from .ratelimit import rate_limit
 
 from django.shortcuts import render, get_object_or_404
 from .models import Category, Thread, Notification
-from django.core.paginator import Paginator
+
+def _with_vote_states(user, page_obj, replies=True):
+    """Load a page's threads (and, unless ``replies`` is false, their replies) and attach the viewer's vote state in bulk."""
+    threads = list(page_obj.object_list)
+    vote_states_for_page(
+        user, threads=threads,
+        replies=[reply for thread in threads for reply in thread.replies.all()] if replies else (),
+    )
+    page_obj.object_list = threads
+    return page_obj
+
 
 def category_detail(request, pk):
     category = get_object_or_404(Category, pk=pk)
-    threads = Thread.objects.filter(category=category).order_by('-created_at')
-
-    paginator = Paginator(threads, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    threads, sort = sort_threads(
+        # The page lists titles and scores only.
+        Thread.objects.filter(category=category),
+        request.GET.get('sort'), request.GET.get('t'),
+    )
 
-    unread_notifications = 0
-    if request.user.is_authenticated:
-        unread_notifications = Notification.objects.filter(
-            user=request.user, is_read=False
-        ).count()
+    page_obj = _with_vote_states(
+        request.user, paginate_threads(request, 'category_detail', threads, ordered_by_date=sort == 'new'),
+        replies=False,
+    )
 
     return render(request, 'category_detail.html', {
         'category': category,
         'page_obj': page_obj,
-        'unread_notifications': unread_notifications,
+        'sort': sort,
+        'period': request.GET.get('t', 'day'),
     })
 
 
@@ -48,39 +68,90 @@ def index(request):
     query = request.GET.get('q', '')
     category_id = request.GET.get('category', '')
 
-    threads = Thread.objects.all().order_by('-created_at')
+    threads, sort = sort_threads(
+        Thread.objects.all()
+        .select_related('author', 'category')
+        .prefetch_related('replies__author'),
+        request.GET.get('sort'), request.GET.get('t'),
+    )
 
+    snippets = {}
     if query:
-        threads = threads.filter(
-            Q(title__icontains=query) |
-            Q(content__icontains=query) |
-            Q(author__username__icontains=query)
-        )
+        threads, snippets = search_threads(threads, query)
 
     if category_id:
         threads = threads.filter(category_id=category_id)
 
-    paginator = Paginator(threads, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = _with_vote_states(
+        request.user, paginate_threads(request, 'index', threads, ordered_by_date=sort == 'new' and not query)
+    )
+    for thread in page_obj:
+        thread.search_snippet = snippets.get(thread.id, '')
 
     categories = Category.objects.all()
-    unread_notifications = 0
-    if request.user.is_authenticated:
-        unread_notifications = Notification.objects.filter(
-            user=request.user, is_read=False
-        ).count()
 
     return render(request, 'index.html', {
         'page_obj': page_obj,
         'categories': categories,
         'query': query,
         'selected_category': category_id,
-        'unread_notifications': unread_notifications,
+        'sort': sort,
+        'period': request.GET.get('t', 'day'),
     })
 
 
 
+@require_GET
+def thread_feed(request):
+    """Cursor-paginated JSON listing of threads for infinite scroll."""
+    category_id = request.GET.get('category', '')
+
+    threads = with_summary_fields(Thread.objects.all())
+    if category_id:
+        threads = threads.filter(category_id=category_id)
+
+    page = paginate_by_cursor(threads, request.GET.get('cursor'), 20)
+
+    return JsonResponse({
+        'threads': serialize_thread_summaries(page, request.user, content_length=None),
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    })
+
+
+@login_required
+@require_GET
+def online_users(request):
+    """Paginated list of users with a live WebSocket, served from the in-memory registry."""
+    per_page = 50
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+
+    offset = (page - 1) * per_page
+    user_ids = online_registry.online_user_ids(offset=offset, limit=per_page + 1)
+    has_next = len(user_ids) > per_page
+    user_ids = user_ids[:per_page]
+
+    usernames = dict(User.objects.filter(id__in=user_ids).values_list('id', 'username'))
+    return JsonResponse({
+        'count': online_registry.count(),
+        'page': page,
+        'has_next': has_next,
+        'users': [
+            {'id': user_id, 'username': usernames[user_id]}
+            for user_id in user_ids if user_id in usernames
+        ],
+    })
+
+
+@user_passes_test(lambda user: user.is_staff)
+def realtime_metrics(request):
+    """Counters and queue depths of the WebSocket layer in this process."""
+    return JsonResponse(metrics.snapshot())
+
+
 def contact(request):
     return render(request, 'contact.html')
 
@@ -92,6 +163,7 @@ def about(request):
 @csrf_exempt
 @login_required
 @require_http_methods(["POST"])
+@rate_limit('new_thread')
 def create_thread(request):
     data = json.loads(request.body)
     form = ThreadForm(data)
@@ -130,6 +202,7 @@ def create_thread_page(request):
 @csrf_exempt
 @login_required
 @require_http_methods(["POST"])
+@rate_limit('new_reply')
 def create_reply(request, thread_id):
     thread = get_object_or_404(Thread, id=thread_id)
     data = json.loads(request.body)
@@ -139,12 +212,13 @@ def create_reply(request, thread_id):
         reply.thread = thread
         reply.author = request.user
         reply.save()
+        record_reply(thread.id, reply.created_at)
 
 
         if thread.author != request.user:
-            Notification.objects.create(
-                user=thread.author,
-                message=f"{request.user.username} replied to your thread '{thread.title}'",
+            notify(
+                thread.author,
+                f"{request.user.username} replied to your thread '{thread.title}'",
                 thread=thread,
                 reply=reply,
             )
@@ -172,26 +246,6 @@ def register(request):
     return render(request, 'register.html', {'form': form})
 
 
-@login_required
-def notifications(request):
-    notifications = Notification.objects.filter(user=request.user).order_by('-created_at')
-
-    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        unread = notifications.filter(is_read=False)
-        data = [{
-            'message': n.message,
-            'created_at': n.created_at.strftime('%Y-%m-%d %H:%M'),
-        } for n in unread]
-
-        # Mark them as read after sending
-        unread.update(is_read=True)
-        return JsonResponse({'notifications': data})
-
-    return render(request, 'notifications.html', {'notifications': notifications})
-
-
-
-
 def login_view(request):
     """Optional custom login view. Fixed: not protected by login_required, uses the
     correct template and redirects to the index on success.
@@ -218,6 +272,7 @@ def login_view(request):
 
 
 @login_required
+@rate_limit('vote')
 def vote(request, model_type, object_id):
     if request.method != 'POST':
         return HttpResponseBadRequest('Only POST method allowed')
@@ -228,36 +283,14 @@ def vote(request, model_type, object_id):
 
     vote_type = int(vote_type)
 
-    try:
-        if model_type == 'thread':
-            content_type = ContentType.objects.get_for_model(Thread)
-            obj = Thread.objects.get(id=object_id)
-        elif model_type == 'reply':
-            content_type = ContentType.objects.get_for_model(Reply)
-            obj = Reply.objects.get(id=object_id)
-        else:
-            return HttpResponseBadRequest('Invalid model type')
-    except (Thread.DoesNotExist, Reply.DoesNotExist):
-        return HttpResponseBadRequest('Object not found')
-
-    vote_obj, created = Vote.objects.get_or_create(
-        content_type=content_type,
-        object_id=object_id,
-        user=request.user,
-        defaults={'vote_type': vote_type}
-    )
+    if model_type not in VOTABLE_MODELS:
+        return HttpResponseBadRequest('Invalid model type')
 
-    if not created:
-        if vote_obj.vote_type == vote_type:
-            vote_obj.delete()
-        else:
-            vote_obj.vote_type = vote_type
-            vote_obj.save()
+    result = cast_vote(model_type, object_id, vote_type, request.user)
+    if result is None:
+        return HttpResponseBadRequest('Object not found')
 
-    return JsonResponse({
-        'vote_count': obj.vote_count(),
-        'user_vote': obj.user_vote(request.user),
-    })
+    return JsonResponse(result)
 
 
 
@@ -288,13 +321,27 @@ def notifications(request):
 
     if request.method == 'POST':
         notifications.update(is_read=True)
+        reset_unread(request.user.id)
         return JsonResponse({'status': 'success'})
 
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        unread = notifications.filter(is_read=False)
+        data = [{
+            'message': n.message,
+            'created_at': n.created_at.strftime('%Y-%m-%d %H:%M'),
+        } for n in unread]
+
+        # Mark them as read after sending
+        unread.update(is_read=True)
+        reset_unread(request.user.id)
+        return JsonResponse({'notifications': data})
+
     return render(request, 'notifications.html', {'notifications': notifications})
 
 
 
 @login_required
+@rate_limit('chat_message')
 def send_chat_message(request):
     if request.method != 'POST':
         return HttpResponseBadRequest('Only POST method allowed')
@@ -303,7 +350,11 @@ def send_chat_message(request):
     if not content:
         return HttpResponseBadRequest('Content is required')
 
-    message = ChatMessage.objects.create(content=content, author=request.user)
+    if chat_write_buffer is not None:
+        message = chat_write_buffer.add(content, request.user)
+    else:
+        message = ChatMessage.objects.create(content=content, author=request.user)
+    async_to_sync(chat_history.append)(serialize_message(message))
     return JsonResponse({
         'id': message.id,
         'content': message.content,
@@ -333,28 +384,15 @@ def search(request):
 
     threads = Thread.objects.all().order_by('-created_at')
 
+    snippets = {}
     if query:
-        threads = threads.filter(
-            Q(title__icontains=query) |
-            Q(content__icontains=query) |
-            Q(author__username__icontains=query)
-        )
+        threads, snippets = search_threads(threads, query)
 
     if category_id:
         threads = threads.filter(category_id=category_id)
 
-    threads_data = []
-    for thread in threads[:20]: 
-        threads_data.append({
-            'id': thread.id,
-            'title': thread.title,
-            'content': thread.content[:100] + '...' if len(thread.content) > 100 else thread.content,
-            'author': thread.author.username,
-            'category': thread.category.name if thread.category else 'General',
-            'created_at': thread.created_at.strftime('%Y-%m-%d %H:%M'),
-            'replies_count': thread.replies.count(),
-            'vote_count': thread.vote_count(),
-        })
+    threads = with_summary_fields(threads)[:20]
+    threads_data = serialize_thread_summaries(threads, request.user, snippets=snippets)
 
     return JsonResponse({'threads': threads_data})
 
@@ -366,14 +404,13 @@ def search_json(request):
 
     results = []
     if q:
-        qs = Thread.objects.filter(
-            Q(title__icontains=q) | Q(content__icontains=q)
-        )[:10]
+        qs, snippets = search_threads(Thread.objects.select_related('author'), q, limit=10)
 
-        for t in qs:
+        for t in qs[:10]:
             results.append({
                 "title": t.title,
                 "meta": t.author.username if t.author else "",
+                "snippet": snippets.get(t.id, ""),
                 "url": f"/thread/{t.id}/",
             })
 
@@ -0,0 +1,145 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .models import Thread, Reply, Vote
+from .ranking import refresh_hot_score
+
+VOTABLE_MODELS = {
+    'thread': Thread,
+    'reply': Reply,
+}
+
+
+def cast_vote(model_type, object_id, vote_type, user):
+    """Apply a vote from ``user`` and update the target's stored counters.
+
+    Voting the same way twice removes the vote, voting the other way switches
+    it. The Vote row and the counter UPDATE share one transaction, so the
+    stored ``score``/``upvotes``/``downvotes`` never drift from the Vote table.
+
+    Returns ``{'vote_count', 'user_vote', 'thread_id'}`` or None when the
+    target is missing; ``thread_id`` is the thread the target belongs to.
+    """
+    model = VOTABLE_MODELS[model_type]
+    content_type = ContentType.objects.get_for_model(model)
+
+    with transaction.atomic():
+        if not model.objects.filter(id=object_id).exists():
+            return None
+
+        vote_obj, created = Vote.objects.get_or_create(
+            content_type=content_type,
+            object_id=object_id,
+            user=user,
+            defaults={'vote_type': vote_type}
+        )
+
+        up_delta = down_delta = 0
+        if created:
+            user_vote = vote_type
+            if vote_type == Vote.UPVOTE:
+                up_delta = 1
+            else:
+                down_delta = 1
+        elif vote_obj.vote_type == vote_type:
+            user_vote = 0
+            vote_obj.delete()
+            if vote_type == Vote.UPVOTE:
+                up_delta = -1
+            else:
+                down_delta = -1
+        else:
+            user_vote = vote_type
+            vote_obj.vote_type = vote_type
+            vote_obj.save(update_fields=['vote_type'])
+            if vote_type == Vote.UPVOTE:
+                up_delta, down_delta = 1, -1
+            else:
+                up_delta, down_delta = -1, 1
+
+        model.objects.filter(id=object_id).update(
+            upvotes=F('upvotes') + up_delta,
+            downvotes=F('downvotes') + down_delta,
+            score=F('score') + up_delta - down_delta,
+        )
+        if model is Reply:
+            score, thread_id = model.objects.filter(id=object_id).values_list('score', 'thread_id').get()
+        else:
+            score = model.objects.filter(id=object_id).values_list('score', flat=True).get()
+            thread_id = object_id
+            refresh_hot_score(thread_id)
+
+    return {'vote_count': score, 'user_vote': user_vote, 'thread_id': thread_id}
+
+
+def rebuild_vote_counters(batch_size=1000):
+    """Recompute every stored vote counter from the Vote table.
+
+    Uses a single grouped query over Vote, then rewrites the counters of
+    each votable model in batches. Returns the number of objects updated.
+    """
+    content_types = ContentType.objects.get_for_models(*VOTABLE_MODELS.values())
+    totals = {model: {} for model in VOTABLE_MODELS.values()}
+    models_by_ct = {ct.id: model for model, ct in content_types.items()}
+
+    grouped = (
+        Vote.objects
+        .filter(content_type__in=content_types.values())
+        .values('content_type', 'object_id')
+        .annotate(
+            up=Count('id', filter=Q(vote_type=Vote.UPVOTE)),
+            down=Count('id', filter=Q(vote_type=Vote.DOWNVOTE)),
+        )
+        .order_by()
+    )
+    for row in grouped:
+        totals[models_by_ct[row['content_type']]][row['object_id']] = (row['up'], row['down'])
+
+    updated = 0
+    with transaction.atomic():
+        for model, counts in totals.items():
+            model.objects.exclude(score=0, upvotes=0, downvotes=0).update(
+                score=0, upvotes=0, downvotes=0
+            )
+            objs = [
+                model(id=object_id, upvotes=up, downvotes=down, score=up - down)
+                for object_id, (up, down) in counts.items()
+            ]
+            model.objects.bulk_update(objs, ['upvotes', 'downvotes', 'score'], batch_size=batch_size)
+            updated += len(objs)
+    return updated
+
+
+def vote_states_for_page(user, threads=(), replies=()):
+    """Resolve the score and ``user``'s own vote for a page of objects.
+
+    Runs at most one Vote query per content type regardless of how many
+    threads and replies are passed. Each object gets a ``current_user_vote``
+    attribute (1, -1 or 0) for templates, and the states are also returned
+    keyed by ``(model_type, object_id)``.
+    """
+    states = {}
+    for model_type, objs in (('thread', threads), ('reply', replies)):
+        objs = list(objs)
+        if not objs:
+            continue
+
+        user_votes = {}
+        if user.is_authenticated:
+            content_type = ContentType.objects.get_for_model(VOTABLE_MODELS[model_type])
+            user_votes = dict(
+                Vote.objects.filter(
+                    content_type=content_type,
+                    user=user,
+                    object_id__in=[obj.id for obj in objs],
+                ).values_list('object_id', 'vote_type')
+            )
+
+        for obj in objs:
+            obj.current_user_vote = user_votes.get(obj.id, 0)
+            states[(model_type, obj.id)] = {
+                'vote_count': obj.score,
+                'user_vote': obj.current_user_vote,
+            }
+    return states
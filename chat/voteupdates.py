@@ -0,0 +1,76 @@
+import asyncio
+
+from django.conf import settings
+
+from . import metrics
+from .broadcast import broadcast
+from .groups import thread_group
+from .votes import VOTABLE_MODELS
+
+
+class VoteUpdateAggregator:
+    """Coalesces ``vote_update`` broadcasts per ``(model_type, object_id)``.
+
+    ``changed()`` only notes which object moved. The first change opens a
+    ``window``-second timer; when it fires, every object noted meanwhile
+    gets one broadcast carrying its current score, read with one query per
+    model type. The score comes from the database rather than from the
+    votes themselves, so concurrent votes finishing out of order can't
+    publish a stale count last.
+
+    Each worker aggregates its own sockets' votes, so a busy object is
+    broadcast at most once per window per worker.
+    """
+
+    def __init__(self, window=0.25):
+        self.window = window
+        self._pending = {}  # (model_type, object_id) -> thread_id
+        self._changes = 0
+        self._task = None
+
+    async def changed(self, channel_layer, model_type, object_id, thread_id):
+        self._pending[(model_type, int(object_id))] = thread_id
+        self._changes += 1
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_after(channel_layer))
+
+    async def _flush_after(self, channel_layer):
+        await asyncio.sleep(self.window)
+        self._task = None
+        try:
+            await self.flush(channel_layer)
+        except Exception as e:
+            print(f"Error broadcasting vote updates: {e}")
+
+    async def flush(self, channel_layer):
+        """Broadcast the current score of every object changed since the last flush."""
+        pending, self._pending = self._pending, {}
+        changes, self._changes = self._changes, 0
+        if not pending:
+            return 0
+
+        by_model = {}
+        for model_type, object_id in pending:
+            by_model.setdefault(model_type, []).append(object_id)
+        scores = {}
+        for model_type, ids in by_model.items():
+            async for object_id, score in VOTABLE_MODELS[model_type].objects.filter(
+                    id__in=ids).values_list('id', 'score'):
+                scores[(model_type, object_id)] = score
+
+        published = 0
+        for (model_type, object_id), thread_id in pending.items():
+            if (model_type, object_id) not in scores:
+                continue
+            await broadcast(channel_layer, thread_group(thread_id), 'vote_update', 'vote', {
+                'model_type': model_type,
+                'object_id': object_id,
+                'vote_count': scores[(model_type, object_id)],
+            }, collapse_key=f'vote:{model_type}:{object_id}')
+            published += 1
+        metrics.increment('vote_updates_broadcast', published)
+        metrics.increment('vote_updates_coalesced', changes - published)
+        return published
+
+
+vote_updates = VoteUpdateAggregator(window=getattr(settings, 'VOTE_BROADCAST_WINDOW_MS', 250) / 1000)
@@ -0,0 +1,74 @@
+import zlib
+
+try:
+    import msgpack
+except ImportError:  # msgpack ships with channels-redis; without it only JSON is offered.
+    msgpack = None
+
+JSON_SUBPROTOCOL = 'forum.v1.json'
+MSGPACK_SUBPROTOCOL = 'forum.v1.msgpack'
+
+# First byte of every binary frame, in both directions.
+FLAG_PLAIN = 0
+FLAG_DEFLATE = 1
+
+# Frames shorter than this are sent plain even with compression on; deflate
+# framing costs more than it saves on a vote update.
+COMPRESS_MIN_BYTES = 96
+
+# Upper bound on an inflated client frame.
+MAX_DECODED_BYTES = 256 * 1024
+
+# Shared by both ends as the deflate preset dictionary, so the field names
+# and event types every message repeats compress to back-references even in
+# a single small frame. Changing it needs a new subprotocol version.
+PRESET_DICTIONARY = b''.join(
+    msgpack.packb(word) if msgpack else word.encode()
+    for word in (
+        'type', 'seq', 'id', 'title', 'content', 'author', 'category', 'created_at',
+        'thread_id', 'reply_id', 'model_type', 'object_id', 'vote_count', 'user_vote',
+        'message', 'messages', 'notification', 'unread_count', 'thread', 'reply', 'vote',
+        'new_thread', 'new_reply', 'vote_update', 'new_chat_message', 'chat_history',
+        'has_more', 'before_id', 'error',
+    )
+)
+
+
+def choose_subprotocol(offered):
+    """Pick the subprotocol to accept from the client's ``Sec-WebSocket-Protocol`` list."""
+    if msgpack is not None and MSGPACK_SUBPROTOCOL in offered:
+        return MSGPACK_SUBPROTOCOL
+    if JSON_SUBPROTOCOL in offered:
+        return JSON_SUBPROTOCOL
+    return None
+
+
+def pack(message):
+    return msgpack.packb(message)
+
+
+def pack_array(packed_items):
+    """Join already packed messages into one msgpack array without re-encoding them."""
+    return msgpack.Packer().pack_array_header(len(packed_items)) + b''.join(packed_items)
+
+
+def encode_frame(packed, compress=False):
+    """Prefix a packed message with its flag byte, deflating it when asked and worthwhile."""
+    if compress and len(packed) >= COMPRESS_MIN_BYTES:
+        deflater = zlib.compressobj(6, zlib.DEFLATED, -15, zdict=PRESET_DICTIONARY)
+        return bytes([FLAG_DEFLATE]) + deflater.compress(packed) + deflater.flush()
+    return bytes([FLAG_PLAIN]) + packed
+
+
+def decode_frame(data):
+    if not data:
+        raise ValueError('Empty frame')
+    body = data[1:]
+    if data[0] == FLAG_DEFLATE:
+        inflater = zlib.decompressobj(-15, zdict=PRESET_DICTIONARY)
+        body = inflater.decompress(body, MAX_DECODED_BYTES)
+        if inflater.unconsumed_tail:
+            raise ValueError('Frame too large')
+    elif data[0] != FLAG_PLAIN:
+        raise ValueError('Unknown frame flag')
+    return msgpack.unpackb(body)
@@ -0,0 +1,75 @@
+import os
+
+MIB = 1024 * 1024
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def sqlite_database(default_path):
+    """Build ``DATABASES['default']`` for SQLite from the environment.
+
+    ``DJANGO_DB_PROFILE=production`` switches on the concurrent-worker
+    profile. Every connection runs the PRAGMAs in ``init_command`` when it
+    opens:
+
+    - WAL journaling, so readers no longer block the writer or each other;
+    - ``synchronous=NORMAL``, which under WAL only fsyncs at checkpoints
+      (a power cut can lose the last commits, never corrupt the file);
+    - ``mmap_size`` and ``cache_size`` for reads from memory.
+
+    Writes wait up to ``SQLITE_BUSY_TIMEOUT_MS`` for the lock instead of
+    failing, and take it when their transaction begins (IMMEDIATE), so
+    a reader upgrading to writer can't deadlock. Connections are kept for
+    ``DB_CONN_MAX_AGE`` seconds instead of being reopened per request.
+
+    Any other profile keeps Django's defaults.
+    """
+    return _sqlite(os.environ.get('SQLITE_PATH') or default_path)
+
+
+def sqlite_replicas():
+    """Build the read replica aliases listed in ``SQLITE_REPLICAS``.
+
+    ``SQLITE_REPLICAS`` is a comma-separated list of copies of the primary
+    file (kept current with ``manage.py sync_replicas``); they become
+    ``replica1``, ``replica2``, ... with the same profile as the primary.
+    Tests read them through ``default`` instead of creating their own.
+    """
+    paths = [path.strip() for path in os.environ.get('SQLITE_REPLICAS', '').split(',') if path.strip()]
+    replicas = {}
+    for number, path in enumerate(paths, start=1):
+        replica = _sqlite(path)
+        replica['TEST'] = {'MIRROR': 'default'}
+        replicas[f'replica{number}'] = replica
+    return replicas
+
+
+def _sqlite(path):
+    database = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path,
+    }
+    if os.environ.get('DJANGO_DB_PROFILE', 'development') != 'production':
+        return database
+
+    pragmas = {
+        'journal_mode': 'WAL',
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'mmap_size': _env_int('SQLITE_MMAP_SIZE', 256 * MIB),
+        # Negative values are KiB rather than pages.
+        'cache_size': _env_int('SQLITE_CACHE_SIZE', -64 * 1024),
+        'temp_store': 'MEMORY',
+    }
+    database.update({
+        'CONN_MAX_AGE': _env_int('DB_CONN_MAX_AGE', 600),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in pragmas.items()),
+            'timeout': _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000,
+            'transaction_mode': 'IMMEDIATE',
+        },
+    })
+    return database
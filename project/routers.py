@@ -0,0 +1,106 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Cookie that keeps a client on the primary for a while after it wrote.
+PIN_COOKIE = 'db_primary_pin'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RequestRouting:
+    __slots__ = ('replica', 'wrote')
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.wrote = False
+
+
+# The router runs for every object a bulk insert prepares, so this is a
+# ContextVar rather than an asgiref Local, whose lookups cost far more.
+_routing = ContextVar('db_request_routing', default=None)
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def use_replica(enabled):
+    """Start routing this request's reads: to one replica if ``enabled``, else to the primary.
+
+    Returns a token for ``finish_request``.
+    """
+    replicas = replica_aliases()
+    return _routing.set(RequestRouting(random.choice(replicas) if enabled and replicas else None))
+
+
+def finish_request(token):
+    """Stop routing reads to a replica; returns whether anything was written meanwhile."""
+    routing = _routing.get()
+    _routing.reset(token)
+    return routing is not None and routing.wrote
+
+
+class PrimaryReplicaRouter:
+    """Sends writes to the primary and a request's reads to one replica.
+
+    Reads only leave the primary inside a request that
+    ``ReplicaRoutingMiddleware`` opened for replica reads. Everything else
+    (WebSocket consumers, management commands, background flushes) keeps
+    reading the primary. A request sticks to the same replica throughout,
+    and once it writes, or while a transaction is open on the primary, its
+    reads go back to the primary so it sees its own changes. Sessions are
+    always read from the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if routing is None or routing.replica is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        # A session missing from a lagging replica would log its user out.
+        if model._meta.app_label == 'sessions':
+            return DEFAULT_DB_ALIAS
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.replica = None
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas are copies of the primary, so objects from any of them relate.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    """Lets safe requests read from a replica, except just after the client wrote.
+
+    A request that writes sets ``PIN_COOKIE`` for ``DATABASE_REPLICA_PIN_SECONDS``,
+    so the redirect and reads that follow see the write even if the replica
+    hasn't caught up yet. Install it before the session middleware, so a
+    session saved on the way out counts as a write.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = use_replica(request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = finish_request(token)
+        if wrote:
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 5),
+                httponly=True, samesite='Lax',
+            )
+        return response
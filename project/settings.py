@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .database import sqlite_database, sqlite_replicas
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,6 +47,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'project.routers.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -66,6 +70,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'chat.context_processors.unread_notifications',
             ],
         },
     },
@@ -93,14 +98,136 @@ CHANNEL_LAYERS = {
 # }
 
 
+# Cache (per-user unread notification counters live here). LocMemCache is
+# per process; use a shared backend when running several workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#         'LOCATION': 'redis://127.0.0.1:6379/1',
+#     },
+# }
+
+
+# Presence: last_seen is kept in memory and written behind. A user's
+# timestamp is re-recorded at most every PRESENCE_WRITE_THROTTLE seconds and
+# pending timestamps are flushed in bulk every PRESENCE_FLUSH_INTERVAL seconds.
+PRESENCE_WRITE_THROTTLE = 60
+PRESENCE_FLUSH_INTERVAL = 30
+
+# A WebSocket that has not sent a heartbeat for ONLINE_TIMEOUT seconds no
+# longer counts its user as online.
+ONLINE_TIMEOUT = 90
+
+# Largest batching window a WebSocket client may opt into with
+# {"type": "set_batching", "window_ms": ...}.
+WEBSOCKET_BATCH_MAX_WINDOW_MS = 1000
+
+# Bounded outgoing queue per WebSocket. When 'maxsize' frames are waiting,
+# 'policy' is 'drop_oldest', 'collapse' (newer frames for the same object
+# replace queued ones, otherwise drop oldest) or 'disconnect' (close the
+# socket with a resync hint). It only fills under a server whose send waits
+# for the client (uvicorn --ws websockets-sansio), not under daphne. Under
+# 'disconnect', the hint and the close frame each get 'close_timeout'
+# seconds before the connection is dropped without them.
+WEBSOCKET_SEND_QUEUE = {
+    'maxsize': 200,
+    'policy': 'collapse',
+    'close_timeout': 1,
+}
+
+# Thread ranking for the "hot" sort (chat.ranking.hot_score): a reply counts
+# as REPLY_WEIGHT votes, and every DECAY_SECONDS of age outweighs ten times
+# the activity. Run `manage.py refresh_rankings` after changing these.
+RANKING = {
+    'REPLY_WEIGHT': 2,
+    'DECAY_SECONDS': 45000,
+}
+
+# Vote count changes are collected per object for this long, then broadcast
+# once with the current score.
+VOTE_BROADCAST_WINDOW_MS = 250
+
+# Broadcast frames carry a sequence number; the last WINDOW frames are kept
+# so a reconnecting client can {"type": "resume"} instead of reloading.
+# 'redis' keeps the sequence and window across restarts and workers.
+EVENT_REPLAY = {
+    'BACKEND': 'local',
+    'WINDOW': 1000,
+    # 'BACKEND': 'redis',
+    # 'REDIS_URL': 'redis://127.0.0.1:6379/2',
+}
+
+# Recent chat messages replayed to every new socket. 'local' keeps them in
+# each worker's memory; 'redis' shares one list between workers.
+CHAT_HISTORY = {
+    'BACKEND': 'local',
+    'SIZE': 50,
+    # 'BACKEND': 'redis',
+    # 'REDIS_URL': 'redis://127.0.0.1:6379/2',
+}
+
+# How chat messages reach the database. 'immediate' inserts each message
+# before it is broadcast. 'buffered' broadcasts first and writes batches of
+# up to BATCH_SIZE messages at least every FLUSH_INTERVAL_MS; messages still
+# buffered when the process is killed (not stopped) are lost. Rows that
+# violate a constraint are dropped; a batch failing MAX_RETRIES flushes in a
+# row is dropped; past MAX_PENDING buffered messages the oldest are dropped.
+CHAT_PERSISTENCE = {
+    'MODE': 'immediate',
+    'BATCH_SIZE': 100,
+    'FLUSH_INTERVAL_MS': 200,
+    'MAX_RETRIES': 5,
+    'MAX_PENDING': 10000,
+}
+
+# Token buckets for write events, per user and per WebSocket connection.
+# Rates are 'count/period' ('30/min', '10/10s'): a burst of up to count,
+# refilled evenly over the period. 'local' keeps buckets in each worker's
+# memory; 'cache' shares them through a cache alias.
+RATE_LIMITS = {
+    'BACKEND': 'local',
+    'EVENTS': {
+        'new_thread': {'user': '5/min'},
+        'new_reply': {'user': '20/min', 'connection': '10/min'},
+        'vote': {'user': '60/min', 'connection': '30/min'},
+        'chat_message': {'user': '30/min', 'connection': '10/10s'},
+    },
+    # 'BACKEND': 'cache',
+    # 'CACHE': 'default',
+}
+
+
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# DJANGO_DB_PROFILE=production enables WAL, relaxed fsync, a busy timeout
+# and persistent connections; see project/database.py for the other
+# SQLITE_* / DB_CONN_MAX_AGE environment variables.
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': sqlite_database(BASE_DIR / 'db.sqlite3'),
+    **sqlite_replicas(),
+}
+
+# Listing and search reads in GET requests go to a random replica from
+# SQLITE_REPLICAS (none by default); writes, WebSockets and commands use the
+# primary. A client that wrote reads from the primary for the next
+# DATABASE_REPLICA_PIN_SECONDS, longer than the replicas are allowed to lag.
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['project.routers.PrimaryReplicaRouter']
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', 5))
+
+# Thread listing pagination per view: 'page' (page numbers), 'cursor'
+# (keyset on created_at/id, no COUNT) or 'auto' (page numbers for small
+# listings, cursors for large ones).
+FORUM_PAGINATION = {
+    'index': 'auto',
+    'category_detail': 'auto',
 }
 
 